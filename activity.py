@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+class XpAccumulator:
+    """
+    発言によるXPの付与を、メモリ上の保留テーブル（ユーザーID → 未反映のXP）に集計し、
+    interval 秒ごとにLedgerへまとめて反映します。
+    連投でXPを稼げないよう、ユーザーごとにトークンバケット方式のクールダウンを設けます。
+    """
+
+    def __init__(self, ledger, interval=60, refill_seconds=5, burst=5):
+        """
+        interval: 保留中のXPをLedgerへ反映する間隔（秒）
+        refill_seconds: XPを獲得できる権利（トークン）が1つ回復するまでの秒数
+        burst: 連続して獲得できるXPの上限（バケットの容量）
+        """
+        self.ledger = ledger
+        self.interval = interval
+        self.refill_seconds = refill_seconds
+        # バケットが満杯の状態から、トークンをすべて使い切るまでに許容される時間の幅
+        self._burst_window = refill_seconds * (burst - 1)
+
+        self.pending = {}
+        # ユーザーごとのバケットを「次にトークンが満たされる時刻」1つで表す（GCRA）
+        self._ready_at = {}
+        self._task = None
+
+    def record(self, user_id):
+        """
+        1件の発言を記録します。クールダウン中の発言は数えません。
+        XPを付与した場合は True を返します。
+        """
+        now = time.monotonic()
+        ready_at = self._ready_at.get(user_id, now)
+        if ready_at < now:
+            ready_at = now
+        if ready_at - now > self._burst_window:
+            return False
+        self._ready_at[user_id] = ready_at + self.refill_seconds
+        self.pending[user_id] = self.pending.get(user_id, 0) + 1
+        return True
+
+    def start(self):
+        """反映タスクを起動します（イベントループ上で呼び出すこと）。"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._merge_loop())
+
+    async def _merge_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.merge()
+            except Exception as e:
+                print(f"❌ Experience System Error: {e}")
+
+    async def merge(self, force=False):
+        """
+        保留中のXPをLedgerへ反映し、反映したユーザー数を返します。
+        Ledgerが書き込み可能になるまでは保留したままにします。
+        force=True はLedgerがリースの引き渡し前の最終反映として呼び出す場合で、writable を確認しません。
+        """
+        if not self.pending or not (force or self.ledger.writable):
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            async with self.ledger.transaction(*batch, force=force) as records:
+                if len(batch) == 1:
+                    records = (records,)
+                for record, delta in zip(records, batch.values()):
+                    record.xp += delta
+        except BaseException:
+            # 反映できなかった分は、その間に加算された分と合わせて保留に戻し、次回の反映で再試行する
+            for user_id, delta in batch.items():
+                self.pending[user_id] = self.pending.get(user_id, 0) + delta
+            raise
+
+        # トークンが満杯まで回復したユーザーのバケットは初期状態と同じなので削除する
+        now = time.monotonic()
+        self._ready_at = {uid: t for uid, t in self._ready_at.items() if t > now}
+        return len(batch)
+
+    async def close(self):
+        """反映タスクを停止し、保留中のXPを反映します。"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.merge()
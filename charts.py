@@ -0,0 +1,152 @@
+import asyncio
+import discord
+import hashlib
+import io
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+# --- [RENDERERS] ---
+# 以下の関数はプロセスプール内で実行される（引数・戻り値はpickle可能な値のみ）
+
+def _setup_matplotlib():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    # 日本語の名前を表示できるフォントがあれば優先して使う
+    plt.rcParams["font.family"] = ["Noto Sans CJK JP", "IPAexGothic", "IPAGothic", "DejaVu Sans"]
+    return plt
+
+def _to_png(plt, fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=110, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+def _render_ranking(data):
+    plt = _setup_matplotlib()
+    names = [row[0] for row in data["rows"]][::-1]
+    values = [row[1] for row in data["rows"]][::-1]
+    fig, ax = plt.subplots(figsize=(7, 0.45 * len(values) + 1.2))
+    ax.barh(names, values, color="#d4a72c")
+    ax.set_title(data["title"])
+    ax.set_xlabel(data["unit"])
+    ax.spines[["top", "right"]].set_visible(False)
+    return _to_png(plt, fig)
+
+def _render_study_heatmap(data):
+    plt = _setup_matplotlib()
+    # data["grid"]: 週（古い順）× 曜日（月～日）の学習分数
+    grid = list(zip(*data["grid"]))
+    fig, ax = plt.subplots(figsize=(0.45 * len(data["grid"]) + 1.5, 3))
+    image = ax.imshow(grid, cmap="Greens", aspect="equal", vmin=0)
+    ax.set_yticks(range(7), ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+    ax.set_xticks(range(len(data["weeks"])), data["weeks"], rotation=60, fontsize=7)
+    ax.set_title(data["title"])
+    fig.colorbar(image, ax=ax, label="min", shrink=0.8)
+    return _to_png(plt, fig)
+
+def _render_balance_history(data):
+    plt = _setup_matplotlib()
+    days = data["days"]
+    fig, ax_money = plt.subplots(figsize=(7, 3.2))
+    ax_money.plot(days, data["money"], color="#64748b", marker="o", markersize=3, label="cr")
+    ax_money.set_ylabel("cr")
+    ax_xp = ax_money.twinx()
+    ax_xp.plot(days, data["xp"], color="#a8b5a2", marker="s", markersize=3, label="xp")
+    ax_xp.set_ylabel("xp")
+    ax_money.set_title(data["title"])
+    ax_money.tick_params(axis="x", rotation=60, labelsize=7)
+    return _to_png(plt, fig)
+
+RENDERERS = {
+    "ranking": _render_ranking,
+    "study_heatmap": _render_study_heatmap,
+    "balance_history": _render_balance_history,
+}
+
+def _render(kind, data):
+    return RENDERERS[kind](data)
+
+
+# --- [DATA PREPARATION] ---
+def study_heatmap_data(history, today, weeks=12, title=""):
+    """study_history（日付 → 分）から、直近 weeks 週分の 週×曜日 の表を作ります。"""
+    start = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    grid = []
+    labels = []
+    for w in range(weeks):
+        monday = start + timedelta(weeks=w)
+        labels.append(monday.strftime("%m/%d"))
+        grid.append([history.get((monday + timedelta(days=d)).isoformat(), 0) for d in range(7)])
+    return {"grid": grid, "weeks": labels, "title": title}
+
+
+class ChartRenderer:
+    """
+    matplotlibによるグラフ描画サービス。描画はプロセスプールで行い、イベントループを止めません。
+    同じ種類・同じデータの描画結果（PNG）は ttl 秒の間キャッシュし、描画中の同じ要求は1回にまとめます。
+    """
+
+    def __init__(self, max_workers=1, ttl=300, max_entries=64):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pool = None
+        self._cache = OrderedDict()
+        self._pending = {}
+
+    @staticmethod
+    def cache_key(kind, data):
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(f"{kind}:{payload}".encode("utf-8")).hexdigest()
+
+    def _cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        png, expires = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return png
+
+    async def render(self, kind, data):
+        """グラフを描画し、PNGのバイト列を返します。"""
+        key = self.cache_key(kind, data)
+        png = self._cached(key)
+        if png is not None:
+            return png
+
+        future = self._pending.get(key)
+        if future is None:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = asyncio.get_running_loop().run_in_executor(self._pool, _render, kind, data)
+            self._pending[key] = future
+            try:
+                png = await future
+            finally:
+                self._pending.pop(key, None)
+            self._cache[key] = (png, time.monotonic() + self.ttl)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return png
+        return await future
+
+    async def render_file(self, kind, data, filename="chart.png"):
+        """描画結果を discord.File として返します（描画に失敗した場合は None）。"""
+        try:
+            png = await self.render(kind, data)
+        except Exception as e:
+            print(f"⚠️ Chart Render Warning ({kind}): {e}")
+            return None
+        return discord.File(io.BytesIO(png), filename=filename)
+
+    def close(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
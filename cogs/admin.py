@@ -1,10 +1,14 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import sys
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+# タイムゾーン設定
+JST = timezone(timedelta(hours=9), 'JST')
 
 class Admin(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
@@ -70,9 +74,8 @@ class Admin(commands.Cog):
     async def admin_grant(self, it: discord.Interaction, target: discord.User, amount: int):
         if not await self.is_admin(it): return
         
-        u_target = self.ledger.get_user(target.id)
-        u_target["money"] += amount
-        self.ledger.save()
+        async with self.ledger.transaction(target.id) as u_target:
+            u_target.money += amount
         
         embed = discord.Embed(title="資産付与完了", color=0x94a3b8)
         embed.add_field(name="対象者", value=target.name, inline=True)
@@ -87,9 +90,8 @@ class Admin(commands.Cog):
     async def admin_confiscate(self, it: discord.Interaction, target: discord.User, amount: int):
         if not await self.is_admin(it): return
         
-        u_target = self.ledger.get_user(target.id)
-        u_target["money"] = max(0, u_target["money"] - amount)
-        self.ledger.save()
+        async with self.ledger.transaction(target.id) as u_target:
+            u_target.money = max(0, u_target.money - amount)
         
         embed = discord.Embed(title="資産回収完了", color=0x475569)
         embed.add_field(name="対象者", value=target.name, inline=True)
@@ -98,6 +100,23 @@ class Admin(commands.Cog):
         
         await it.response.send_message(embed=embed)
 
+    # --- 未使用記録の整理 ---
+    @app_commands.command(name="admin_compact", description="[管理者専用] 未使用のユーザー記録を削除し、古い学習履歴を集約します")
+    async def admin_compact(self, it: discord.Interaction):
+        if not await self.is_admin(it): return
+        # 全ユーザーの走査は応答期限（3秒）を超えることがあるため、先に応答を保留する
+        await it.response.defer(ephemeral=True)
+
+        removed = self.ledger.compact_defaults()
+        compacted = await self.ledger.compact_study_history(datetime.now(JST).date(), force=True)
+
+        embed = discord.Embed(title="Ledger整理完了", color=0x94a3b8)
+        embed.add_field(name="削除した記録", value=f"```fix\n{removed:,} 件\n```", inline=False)
+        embed.add_field(name="学習履歴を集約したユーザー", value=f"```fix\n{compacted:,} 人\n```", inline=False)
+        embed.set_footer(text="Rb m/25E 管理者専用システム")
+
+        await it.followup.send(embed=embed, ephemeral=True)
+
     # --- システム再起動 ---
     @app_commands.command(name="shutdown", description="BOTシステムを終了します")
     async def restart(self, it: discord.Interaction):
@@ -109,8 +128,8 @@ class Admin(commands.Cog):
         await it.response.send_message(embed=embed)
         print(f"[SYSTEM] シャットダウンコマンドが実行されました: 実行者 {it.user.name}")
         
-        sys.exit()
+        # sys.exit() では未保存の変更が失われるため、Ledgerを保存してから終了する
+        await self.bot.close()
 
 async def setup(bot):
-    from __main__ import ledger_instance
-    await bot.add_cog(Admin(bot, ledger_instance))
+    await bot.add_cog(Admin(bot, bot.ledger))
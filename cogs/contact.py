@@ -2,6 +2,7 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from datetime import datetime
+import asyncio
 import re
 
 # --- [TACTICAL CONSTANTS] ---
@@ -101,24 +102,31 @@ class ReplyModal(discord.ui.Modal):
 
 # --- [MAIN COG] ---
 class Contact(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
         self.bl_key = "contact_blacklist"
         
-        # Ledgerからブラックリストを読み込む (データがない場合は空リスト)
         # JSON保存時はリストだが、高速処理のためメモリ内ではset(集合)として扱う
+        self.blacklist = set()
+
+    async def cog_load(self):
+        # Ledgerの読み込み完了後にブラックリストを読み込む（起動処理はブロックしない）
         if self.ledger:
-            raw_data = self.ledger.data.get(self.bl_key, [])
-            self.blacklist = set(int(uid) for uid in raw_data if str(uid).isdigit())
-        else:
-            self.blacklist = set()
+            asyncio.create_task(self._load_blacklist())
+
+    async def _load_blacklist(self):
+        """Ledgerからブラックリストを読み込む (データがない場合は空リスト)"""
+        if await self.ledger.wait_ready():
+            raw_data = self.ledger.get_meta(self.bl_key, [])
+            self.blacklist |= set(int(uid) for uid in raw_data if str(uid).isdigit())
 
     def _save_blacklist(self):
-        """ブラックリストの変更をGist(Ledger)に即時保存する"""
+        """ブラックリストの変更をLedgerに記録する（Gistへの保存はバックグラウンドで行われる）"""
         if self.ledger:
-            self.ledger.data[self.bl_key] = list(self.blacklist)
-            self.ledger.save()
+            self.ledger.set_meta(self.bl_key, list(self.blacklist))
 
     # --- Admin: Blacklist Management ---
     blacklist_group = app_commands.Group(name="contact_admin_blacklist", description="[Admin Only] Contact機能のブラックリスト管理")
@@ -285,6 +293,4 @@ class Contact(commands.Cog):
             await it.followup.send(f"❌ 送信エラー: {e}", ephemeral=True)
 
 async def setup(bot):
-    # main.py のグローバル変数 ledger_instance を取得してCogに渡す
-    from __main__ import ledger_instance
-    await bot.add_cog(Contact(bot, ledger_instance))
+    await bot.add_cog(Contact(bot, bot.ledger))
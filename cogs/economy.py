@@ -1,14 +1,14 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import asyncio
 from datetime import datetime
 
 class Economy(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
-        self.lock = asyncio.Lock()  # データ競合防止用
 
     # --- デザイン定数 ---
     COLOR_NORDIC_GREEN = 0xA8B5A2  # 落ち着いたセージグリーン
@@ -41,38 +41,37 @@ class Economy(commands.Cog):
             )
 
         # 2. ロジック実行（データ整合性を確保）
-        async with self.lock:
-            u_sender = self.ledger.get_user(it.user.id)
-            current_balance = u_sender.get("money", 0)
+        # 残高不足ならロックも記録の作成もせずに応答する（記録のないユーザーは初期値の所持金で判定される）
+        current_balance = self.ledger.peek_user(it.user.id).money
+        if current_balance >= amount:
+            # 送金元・送金先のロックを取得して更新（他のユーザーの取引は並行して処理される）
+            async with self.ledger.transaction(it.user.id, target.id) as (u_sender, u_target):
+                current_balance = u_sender.money
+                if current_balance >= amount:
+                    u_sender.money -= amount
+                    u_target.money += amount
 
-            if current_balance < amount:
-                return await it.response.send_message(
-                    embed=discord.Embed(
-                        description=f"残高が不足しています。\n現在の所持金: `{current_balance:,} cr`", 
-                        color=self.COLOR_SOFT_ERROR
-                    ),
-                    ephemeral=True
-                )
+        if current_balance < amount:
+            return await it.response.send_message(
+                embed=discord.Embed(
+                    description=f"残高が不足しています。\n現在の所持金: `{current_balance:,} cr`", 
+                    color=self.COLOR_SOFT_ERROR
+                ),
+                ephemeral=True
+            )
 
-            # 更新処理
-            u_target = self.ledger.get_user(target.id)
-            u_sender["money"] = current_balance - amount
-            u_target["money"] = u_target.get("money", 0) + amount
-            
-            # Gistへの保存（I/Oブロッキング回避）
-            try:
-                await asyncio.to_thread(self.ledger.save)
-            except Exception as e:
-                # 失敗時のロールバック的な表示（簡易版）
-                return await it.response.send_message(
-                    embed=discord.Embed(description="システムエラー：取引を完了できませんでした。", color=self.COLOR_SOFT_ERROR),
-                    ephemeral=True
-                )
+        # 送金は応答前に永続化を確定させる（保存には3秒以上かかり得るため、先に応答を保留する）
+        await it.response.defer()
+        if await self.ledger.flush():
+            description = "送金リクエストが正常に承認されました。"
+        else:
+            # 送金はすでに反映・ジャーナルへ記録済みのため、取り消さずに保存の遅れだけを伝える
+            description = "送金は反映されましたが、保存はまだ完了していません。"
 
         # 3. 成功時UIデザイン
         embed = discord.Embed(
             title="Transaction Receipt",
-            description="送金リクエストが正常に承認されました。",
+            description=description,
             color=self.COLOR_NORDIC_GREEN,
             timestamp=datetime.now()
         )
@@ -100,14 +99,14 @@ class Economy(commands.Cog):
         if it.guild and it.guild.icon:
             embed.set_footer(text=self.FOOTER_TEXT, icon_url=it.guild.icon.url)
         
-        await it.response.send_message(embed=embed)
+        await it.followup.send(embed=embed)
 
     @app_commands.command(name="balance", description="現在の資産と貢献度を確認します")
     async def balance(self, it: discord.Interaction):
         """資産確認：カード型UI"""
-        user_data = self.ledger.get_user(it.user.id)
-        money = user_data.get("money", 0)
-        xp = user_data.get("xp", 0)
+        user_data = self.ledger.peek_user(it.user.id)
+        money = user_data.money
+        xp = user_data.xp
         
         embed = discord.Embed(
             title=f"Portfolio: {it.user.display_name}",
@@ -120,10 +119,27 @@ class Economy(commands.Cog):
         embed.add_field(name="Total Contribution", value=f"**{xp:,}** points", inline=False)
         
         embed.set_footer(text="Official Financial Report")
-        
-        await it.response.send_message(embed=embed)
+
+        history = user_data.balance_history
+        if len(history) < 2:
+            await it.response.send_message(embed=embed)
+            return
+
+        # 日ごとの残高推移グラフ（描画は別プロセス、同じ内容なら描画済みの画像を再利用）
+        await it.response.defer()
+        days = sorted(history)
+        data = {
+            "title": "Balance history",
+            "days": [d[5:] for d in days],
+            "money": [history[d][0] for d in days],
+            "xp": [history[d][1] for d in days],
+        }
+        chart = await self.bot.charts.render_file("balance_history", data, filename="balance.png")
+        if chart:
+            embed.set_image(url="attachment://balance.png")
+            await it.followup.send(embed=embed, file=chart)
+        else:
+            await it.followup.send(embed=embed)
 
 async def setup(bot):
-    # main.pyからインスタンスを取得する際の標準的な構成
-    from __main__ import ledger_instance
-    await bot.add_cog(Economy(bot, ledger_instance))
+    await bot.add_cog(Economy(bot, bot.ledger))
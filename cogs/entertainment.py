@@ -4,6 +4,8 @@ from discord import app_commands
 import random
 
 class Entertainment(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
@@ -35,9 +37,8 @@ class Entertainment(commands.Cog):
             result_text = "おめでとうございます！ **あなたの勝ち** です！"
             color = 0x2ecc71 # 緑
             # 勝利報酬の付与
-            u = self.ledger.get_user(it.user.id)
-            u["money"] += 10
-            self.ledger.save()
+            async with self.ledger.transaction(it.user.id) as u:
+                u.money += 10
             reward_msg = "💰 報酬として **10 cr** を付与しました。"
         else:
             result_text = "残念... **あなたの負け** です。"
@@ -79,5 +80,4 @@ class Entertainment(commands.Cog):
         await it.response.send_message(embed=embed)
 
 async def setup(bot):
-    from __main__ import ledger_instance
-    await bot.add_cog(Entertainment(bot, ledger_instance))
+    await bot.add_cog(Entertainment(bot, bot.ledger))
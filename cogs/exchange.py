@@ -3,6 +3,8 @@ from discord.ext import commands
 from discord import app_commands
 
 class Exchange(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
@@ -19,8 +21,7 @@ class Exchange(commands.Cog):
             await it.response.send_message("❌ 1 XP以上を指定してください。", ephemeral=True)
             return
 
-        u = self.ledger.get_user(it.user.id)
-        current_xp = u.get("xp", 0)
+        current_xp = self.ledger.peek_user(it.user.id).xp
 
         if current_xp < amount:
             await it.response.send_message(
@@ -39,10 +40,20 @@ class Exchange(commands.Cog):
             )
             return
 
-        # データの更新
-        u["xp"] -= amount
-        u["money"] += receive_money
-        self.ledger.save()
+        # データの更新（確認から更新までの間に他のコマンドで消費されていないか、ロック内で再確認する）
+        async with self.ledger.transaction(it.user.id) as u:
+            current_xp = u.xp
+            if current_xp >= amount:
+                u.xp -= amount
+                u.money += receive_money
+            balance = u.money
+
+        if current_xp < amount:
+            await it.response.send_message(
+                f"❌ XPが不足しています。\n保有: `{current_xp:,} XP` / 入力: `{amount:,} XP`", 
+                ephemeral=True
+            )
+            return
 
         embed = discord.Embed(
             title="💎 資産換金完了",
@@ -51,12 +62,11 @@ class Exchange(commands.Cog):
         )
         embed.add_field(name="📉 消費した貢献度", value=f"`{amount:,} XP`", inline=True)
         embed.add_field(name="📈 獲得した資産", value=f"`{receive_money:,} cr`", inline=True)
-        embed.add_field(name="💰 現在の総資産", value=f"`{u['money']:,} cr`", inline=False)
+        embed.add_field(name="💰 現在の総資産", value=f"`{balance:,} cr`", inline=False)
         
         embed.set_footer(text=f"Rb m/25 Exchange Rate: 10 XP = 1 cr")
         
         await it.response.send_message(embed=embed)
 
 async def setup(bot):
-    from __main__ import ledger_instance
-    await bot.add_cog(Exchange(bot, ledger_instance))
+    await bot.add_cog(Exchange(bot, bot.ledger))
@@ -3,96 +3,168 @@ from discord import app_commands
 from discord.ext import commands
 import random
 import asyncio
-from datetime import datetime
+import heapq
+import math
+import time
+from fishing_catalog import FishCatalog, LOCATIONS, RARITY_ORDER
+from fishing_records import FishRecordBook
+
+# 管理者ID（図鑑の再読み込み用）
+ADMIN_ID = 840821281838202880
+# 魚の図鑑・出現テーブルのデータファイル
+CATALOG_PATH = "fish_catalog.json"
+# 1回のコマンドでまとめて釣れる最大回数
+MAX_CASTS = 10
+# 1投あたりのクールダウン（秒）。まとめ釣りでも投げた回数分だけ積み上がる
+CAST_COOLDOWN = 5
+# 釣れたら演出する大物のレア度
+BIG_RARITIES = ("SSR", "LEGEND", "TREASURE")
+
+COLOR_MAP = {
+    "ゴミ": discord.Color.dark_gray(),
+    "N": discord.Color.blue(),
+    "R": discord.Color.green(),
+    "SR": discord.Color.purple(),
+    "SSR": discord.Color.gold(),
+    "LEGEND": discord.Color.from_rgb(255, 0, 0),
+    "TREASURE": discord.Color.from_rgb(0, 255, 255)
+}
+
+def appraise(fish_base):
+    """獲物のサイズ（一様分布）と価格（base_price * サイズ / 最小サイズ）を決めます。"""
+    low, high = fish_base["size_range"]
+    size = round(random.uniform(low, high), 1)
+    return size, int(fish_base["base_price"] * (size / low))
 
 class Fishing(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot):
         self.bot = bot
-        # 獲物リスト（名前, 基本価格, サイズ範囲, レア度, 出現の重み）
-        # 全体的に価格を抑え、レアリティの重みを厳しく調整
-        self.FISH_POOL = [
-            # ゴミ (Weights: 25) - ほぼ換金価値なし
-            {"name": "長靴", "base_price": 2, "size_range": (20, 30), "rarity": "ゴミ", "weight": 10},
-            {"name": "空き缶", "base_price": 1, "size_range": (5, 10), "rarity": "ゴミ", "weight": 10},
-            {"name": "ビニール袋", "base_price": 1, "size_range": (30, 50), "rarity": "ゴミ", "weight": 5},
-
-            # 一般 (Weights: 60) - メインの収入源
-            {"name": "アジ", "base_price": 15, "size_range": (15, 30), "rarity": "N", "weight": 15},
-            {"name": "イワシ", "base_price": 10, "size_range": (10, 25), "rarity": "N", "weight": 15},
-            {"name": "サバ", "base_price": 25, "size_range": (25, 45), "rarity": "N", "weight": 10},
-            {"name": "キス", "base_price": 12, "size_range": (10, 25), "rarity": "N", "weight": 10},
-            {"name": "メバル", "base_price": 20, "size_range": (15, 35), "rarity": "N", "weight": 10},
-
-            # レア (Weights: 12) - ちょっと嬉しい
-            {"name": "マダイ", "base_price": 80, "size_range": (30, 90), "rarity": "R", "weight": 4},
-            {"name": "クロダイ", "base_price": 70, "size_range": (30, 60), "rarity": "R", "weight": 4},
-            {"name": "スズキ", "base_price": 100, "size_range": (50, 100), "rarity": "R", "weight": 3},
-            {"name": "アオリイカ", "base_price": 90, "size_range": (20, 50), "rarity": "R", "weight": 1},
-
-            # スーパーレア (Weights: 2.5) - 誇れる釣果
-            {"name": "ブリ", "base_price": 350, "size_range": (80, 120), "rarity": "SR", "weight": 1.0},
-            {"name": "ホンマグロ", "base_price": 600, "size_range": (150, 300), "rarity": "SR", "weight": 1.0},
-            {"name": "クエ", "base_price": 800, "size_range": (60, 130), "rarity": "SR", "weight": 0.5},
-
-            # ウルトラレア・伝説 (Weights: 0.5) - サーバーの英雄レベル
-            {"name": "リュウグウノツカイ", "base_price": 2500, "size_range": (300, 700), "rarity": "SSR", "weight": 0.2},
-            {"name": "黄金のシャチ", "base_price": 5000, "size_range": (500, 800), "rarity": "SSR", "weight": 0.2},
-            {"name": "ポセイドンの三叉槍", "base_price": 12000, "size_range": (200, 210), "rarity": "LEGEND", "weight": 0.05},
-            {"name": "古びた宝箱", "base_price": 8000, "size_range": (50, 60), "rarity": "TREASURE", "weight": 0.05},
-        ]
+        # 獲物の図鑑と、釣り場・時間帯・イベントごとの出現テーブル（エイリアス表は読み込み時に構築）
+        self.catalog = FishCatalog(CATALOG_PATH)
+        # 歴代記録（初回利用時にLedgerから読み込む）
+        self.records = None
+        # ユーザーごとの「次に満タンになる時刻」（釣りのクールダウン）
+        self._ready_at = {}
+
+    def record_book(self):
+        """歴代記録を返します。保存された記録が無ければ、各ユーザーの自己ベストから作り直します。"""
+        if self.records is None:
+            ledger = self.bot.ledger
+            saved = ledger.get_meta(FishRecordBook.META_KEY)
+            if saved:
+                self.records = FishRecordBook.from_dict(saved)
+            else:
+                self.records = FishRecordBook.rebuild(ledger.users())
+                print(f"📖 Fishing records rebuilt from personal bests ({len(self.records.species)} species)")
+        return self.records
+
+    def note_records(self, user_id, catches):
+        """
+        catches（[(図鑑の項目, サイズ, 釣った時刻), ...]）で歴代記録を更新し、更新があった場合のみ1回だけ保存対象にします。
+        獲物ごとの (全体順位, 種の新記録か) のリストを返します。
+        """
+        book = self.record_book()
+        results = [book.note(user_id, fish_base["name"], fish_base["rarity"], size, ts) for fish_base, size, ts in catches]
+        if any(rank or species_record for rank, species_record in results) and self.bot.ledger.writable:
+            self.bot.ledger.set_meta(FishRecordBook.META_KEY, book.to_dict())
+        return results
+
+    def reserve_casts(self, user_id, casts):
+        """
+        クールダウン（GCRA）を確認します。投げられる場合は枠を確保して 0 を、
+        まだ投げられない場合は残りの待ち時間（秒）を返します。
+        1投ごとに CAST_COOLDOWN 秒が積み上がり、MAX_CASTS 投分までは先に使えます。
+        """
+        now = time.monotonic()
+        ready_at = max(self._ready_at.get(user_id, now), now) + casts * CAST_COOLDOWN
+        wait = ready_at - now - MAX_CASTS * CAST_COOLDOWN
+        if wait > 0:
+            return wait
+        self._ready_at[user_id] = ready_at
+        if len(self._ready_at) > 1024:
+            self._ready_at = {uid: t for uid, t in self._ready_at.items() if t > now}
+        return 0
 
     @app_commands.command(name="fishing", description="釣りをします。")
-    async def fishing(self, interaction: discord.Interaction):
-        await interaction.response.send_message("🎣 釣り糸を垂らしました。アタリを待っています...")
+    @app_commands.describe(location="釣り場", casts=f"まとめて釣る回数（1～{MAX_CASTS}）")
+    @app_commands.choices(location=[
+        app_commands.Choice(name=label, value=key) for key, label in LOCATIONS.items()
+    ])
+    async def fishing(self, interaction: discord.Interaction, location: str = "sea",
+                      casts: app_commands.Range[int, 1, MAX_CASTS] = 1):
+        wait = self.reserve_casts(interaction.user.id, casts)
+        if wait:
+            await interaction.response.send_message(f"⏳ 竿の手入れ中だ... あと **{math.ceil(wait)}秒** 待ってくれ。", ephemeral=True)
+            return
+
+        label = f"{casts}本の釣り糸" if casts > 1 else "釣り糸"
+        await interaction.response.send_message(f"🎣 {LOCATIONS[location]}に{label}を垂らしました。アタリを待っています...")
         await asyncio.sleep(random.randint(3, 6))
 
-        weights = [f["weight"] for f in self.FISH_POOL]
-        fish_base = random.choices(self.FISH_POOL, weights=weights, k=1)[0]
+        # 全投分を1回で抽選し、1回のトランザクションで生け簀へ追加する
+        fishes, pool = self.catalog.cast_many(location, casts)
+        caught_at = time.time()
+        catches = [(fish_base, *appraise(fish_base)) for fish_base in fishes]
+        added = []
+        async with self.bot.ledger.transaction(interaction.user.id) as user_data:
+            for fish_base, size, price in catches:
+                item_id = user_data.get_inventory().add(fish_base["name"], fish_base["rarity"], size, price, caught_at)
+                personal_rank = user_data.note_catch(fish_base["name"], fish_base["rarity"], size, caught_at)
+                added.append((item_id, personal_rank))
+        records = self.note_records(interaction.user.id, [(fish_base, size, caught_at) for fish_base, size, _ in catches])
 
-        size = round(random.uniform(fish_base["size_range"][0], fish_base["size_range"][1]), 1)
-        size_multiplier = size / fish_base["size_range"][0]
-        price = int(fish_base["base_price"] * size_multiplier)
+        big_catch = any(fish_base["rarity"] in BIG_RARITIES for fish_base, _, _ in catches)
+        if casts == 1:
+            (fish_base, size, price), (item_id, _) = catches[0], added[0]
+            embed = discord.Embed(title=f"🐟 釣果報告！ (#{item_id})", color=COLOR_MAP.get(fish_base["rarity"], discord.Color.default()))
+            embed.add_field(name="獲物", value=f"**{fish_base['name']}**", inline=True)
+            embed.add_field(name="サイズ", value=f"**{size} cm**", inline=True)
+            embed.add_field(name="推定価値", value=f"**{price} cr**", inline=True)
+            embed.add_field(name="レア度", value=fish_base["rarity"], inline=True)
+        else:
+            embed = self.batch_embed(catches, added)
 
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        if "fishing_inventory" not in user_data:
-            user_data["fishing_inventory"] = []
+        achievements = []
+        # 歴代順位は最も上位に入った1匹だけ、種の新記録は種ごとに1回だけ表示する
+        ranked = [(rank, fish_base["name"], size) for (fish_base, size, _), (rank, _) in zip(catches, records) if rank and rank <= 10]
+        if ranked:
+            rank, name, size = min(ranked)
+            achievements.append(f"🏆 {name} ({size} cm) が歴代 **{rank}位** の大物！")
+        species_records = dict.fromkeys(fish_base["name"] for (fish_base, _, _), (_, new) in zip(catches, records) if new)
+        achievements.extend(f"📖 {name} の最大記録を更新！" for name in species_records)
+        if any(personal_rank == 1 for _, personal_rank in added):
+            achievements.append("🏅 自己ベスト更新！")
+        if achievements:
+            embed.add_field(name="記録", value="\n".join(achievements[:10]), inline=False)
+        if pool.event:
+            embed.set_footer(text=f"🎆 イベント開催中: {pool.event['name']}")
         
-        new_item = {
-            "name": fish_base["name"],
-            "size": size,
-            "price": price,
-            "rarity": fish_base["rarity"],
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-        }
-        user_data["fishing_inventory"].append(new_item)
-        self.bot.ledger.save()
-
-        color_map = {
-            "ゴミ": discord.Color.dark_gray(),
-            "N": discord.Color.blue(),
-            "R": discord.Color.green(),
-            "SR": discord.Color.purple(),
-            "SSR": discord.Color.gold(),
-            "LEGEND": discord.Color.from_rgb(255, 0, 0),
-            "TREASURE": discord.Color.from_rgb(0, 255, 255)
-        }
-        color = color_map.get(fish_base["rarity"], discord.Color.default())
-
-        embed = discord.Embed(title="🐟 釣果報告！", color=color)
-        embed.add_field(name="獲物", value=f"**{fish_base['name']}**", inline=True)
-        embed.add_field(name="サイズ", value=f"**{size} cm**", inline=True)
-        embed.add_field(name="推定価値", value=f"**{price} cr**", inline=True)
-        embed.add_field(name="レア度", value=fish_base["rarity"], inline=True)
-        
-        if fish_base["rarity"] in ["SSR", "LEGEND", "TREASURE"]:
+        if big_catch:
             await interaction.edit_original_response(content="🎊 **大物だぁぁぁ！！** 🎊", embed=embed)
         else:
             await interaction.edit_original_response(content=None, embed=embed)
 
+    def batch_embed(self, catches, added):
+        """まとめ釣りの結果を、レア度の高い順にまとめたEmbedを作ります。"""
+        order = {r: i for i, r in enumerate(RARITY_ORDER)}
+        groups = {}
+        for (fish_base, size, price), (item_id, _) in zip(catches, added):
+            groups.setdefault(fish_base["rarity"], []).append(f"`#{item_id}` {fish_base['name']} ({size}cm / {price} cr)")
+        best_rarity = max(groups, key=lambda r: order.get(r, -1))
+        total = sum(price for _, _, price in catches)
+
+        embed = discord.Embed(title=f"🐟 まとめ釣り 釣果報告！ ({len(catches)}匹)", color=COLOR_MAP.get(best_rarity, discord.Color.default()))
+        for rarity in sorted(groups, key=lambda r: order.get(r, -1), reverse=True):
+            embed.add_field(name=f"{rarity} × {len(groups[rarity])}", value="\n".join(groups[rarity]), inline=False)
+        embed.add_field(name="推定価値（合計）", value=f"**{total:,} cr**", inline=False)
+        return embed
+
     @app_commands.command(name="fishing_inventory", description="所持している獲物一覧を表示します。")
     async def fishing_inventory(self, interaction: discord.Interaction):
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        inventory = user_data.get("fishing_inventory", [])
+        user_data = self.bot.ledger.peek_user(interaction.user.id)
+        inventory = user_data.fishing_inventory
 
         if not inventory:
             await interaction.response.send_message("🪣 生け簀は空っぽだ。", ephemeral=True)
@@ -100,94 +172,172 @@ class Fishing(commands.Cog):
 
         embed = discord.Embed(title=f"🪣 {interaction.user.display_name} の生け簀", color=discord.Color.blue())
         desc = ""
-        display_items = inventory[-20:]
-        offset = len(inventory) - len(display_items)
-        
-        for i, item in enumerate(display_items):
-            desc += f"`{offset + i}`: **{item['name']}** ({item['size']}cm) / {item['price']} cr\n"
+        # 新しい順に20匹。番号は売却しても変わらない獲物のID
+        for item in inventory.latest(20):
+            desc += f"`#{item.id}`: **{item.name}** ({item.size}cm) / {item.price} cr\n"
         
         embed.description = desc
-        embed.set_footer(text=f"合計所持数: {len(inventory)} 匹")
+        rarity_totals = " / ".join(f"{rarity}: {count}" for rarity, (count, _) in inventory.by_rarity().items())
+        embed.add_field(name="内訳", value=rarity_totals, inline=False)
+        embed.set_footer(text=f"合計所持数: {len(inventory)} 匹 | 総額: {inventory.total_value:,} cr")
         await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="fishing_sale", description="獲物を売却してcrを獲得します。")
-    @app_commands.describe(target="番号、または 'all' で全売却")
+    @app_commands.describe(target="獲物の番号（#の後の数字）、または 'all' で全売却")
     async def fishing_sale(self, interaction: discord.Interaction, target: str):
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        inventory = user_data.get("fishing_inventory", [])
-
-        if not inventory:
+        if not self.bot.ledger.peek_user(interaction.user.id).fishing_inventory:
             await interaction.response.send_message("❌ 売却するものが何もないぞ。", ephemeral=True)
             return
 
-        if target.lower() == "all":
-            total_price = sum(item["price"] for item in inventory)
-            count = len(inventory)
-            user_data["money"] = user_data.get("money", 0) + total_price
-            user_data["fishing_inventory"] = []
-            self.bot.ledger.save()
-            await interaction.response.send_message(f"💰 **{count}匹** をすべて売却し、**{total_price} cr** を獲得した！")
-        else:
-            try:
-                idx = int(target)
-                if 0 <= idx < len(inventory):
-                    item = inventory.pop(idx)
-                    price = item["price"]
-                    user_data["money"] = user_data.get("money", 0) + price
-                    self.bot.ledger.save()
-                    await interaction.response.send_message(f"💰 **{item['name']}** ({item['size']}cm) を売却し、**{price} cr** を獲得した！")
+        # 売却中に釣果が追加されても取りこぼさないよう、ロック内で在庫の確認と更新を行う
+        message = None
+        async with self.bot.ledger.transaction(interaction.user.id) as user_data:
+            inventory = user_data.get_inventory()
+
+            if target.lower() == "all":
+                count, total_price = inventory.clear()
+                user_data.money += total_price
+                message = f"💰 **{count}匹** をすべて売却し、**{total_price} cr** を獲得した！"
+            else:
+                try:
+                    item_id = int(target.lstrip("#"))
+                except ValueError:
+                    error = "❌ 番号を入力するか、'all' と入力してくれ。"
                 else:
-                    await interaction.response.send_message("❌ その番号の獲物はいないようだ。", ephemeral=True)
-            except ValueError:
-                await interaction.response.send_message("❌ 番号を入力するか、'all' と入力してくれ。", ephemeral=True)
+                    item = inventory.remove(item_id)
+                    if item:
+                        user_data.money += item.price
+                        message = f"💰 **{item.name}** ({item.size}cm) を売却し、**{item.price} cr** を獲得した！"
+                    else:
+                        error = "❌ その番号の獲物はいないようだ。"
+
+        if message:
+            await interaction.response.send_message(message)
+        else:
+            await interaction.response.send_message(error, ephemeral=True)
+
+    @app_commands.command(name="fishing_sale_filter", description="条件に合う獲物をまとめて売却します（条件はすべて満たすものが対象）。")
+    @app_commands.describe(
+        rarity="このレア度以下の獲物",
+        max_size="このサイズ（cm）未満の獲物",
+        species="この名前の獲物",
+        older_than="この日数より前に釣った獲物",
+    )
+    @app_commands.choices(rarity=[
+        app_commands.Choice(name=f"{r} 以下", value=r) for r in RARITY_ORDER
+    ])
+    async def fishing_sale_filter(self, interaction: discord.Interaction, rarity: str = None,
+                                  max_size: float = None, species: str = None, older_than: int = None):
+        conditions = []
+        if rarity is not None:
+            limit = RARITY_ORDER.index(rarity)
+            # 序列にないレア度（図鑑に後から追加されたもの等）は売却対象にしない
+            conditions.append(lambda item: item.rarity in RARITY_ORDER and RARITY_ORDER.index(item.rarity) <= limit)
+        if max_size is not None:
+            conditions.append(lambda item: item.size < max_size)
+        if species:
+            conditions.append(lambda item: item.name == species)
+        if older_than is not None:
+            cutoff = time.time() - older_than * 86400
+            conditions.append(lambda item: item.ts < cutoff)
+        if not conditions:
+            await interaction.response.send_message("❌ 条件を1つ以上指定してくれ。（全売却は `/fishing_sale all`）", ephemeral=True)
+            return
+
+        # 条件に合うものを1回の走査で選び、1回のトランザクション（保存も1回）で売却する
+        async with self.bot.ledger.transaction(interaction.user.id) as user_data:
+            sold = user_data.get_inventory().remove_where(lambda item: all(c(item) for c in conditions))
+            total_price = sum(item.price for item in sold)
+            user_data.money += total_price
+            remaining = len(user_data.fishing_inventory)
+
+        if not sold:
+            await interaction.response.send_message("🪣 条件に合う獲物はいなかった。", ephemeral=True)
+            return
+
+        by_rarity = {}
+        for item in sold:
+            count, value = by_rarity.get(item.rarity, (0, 0))
+            by_rarity[item.rarity] = (count + 1, value + item.price)
+        embed = discord.Embed(title="🧾 まとめ売り 明細", color=discord.Color.green())
+        order = {r: i for i, r in enumerate(RARITY_ORDER)}
+        embed.description = "\n".join(
+            f"**{r}**: {count}匹 / {value:,} cr"
+            for r, (count, value) in sorted(by_rarity.items(), key=lambda kv: order.get(kv[0], len(order)))
+        )
+        embed.add_field(name="売却数", value=f"**{len(sold)}匹**", inline=True)
+        embed.add_field(name="獲得", value=f"**{total_price:,} cr**", inline=True)
+        embed.add_field(name="残り", value=f"{remaining}匹", inline=True)
+        await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="fishing_ranking", description="大物ランキングを表示します。")
-    async def fishing_ranking(self, interaction: discord.Interaction):
+    @app_commands.describe(scope="集計範囲（このサーバー / 全体）")
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="このサーバー", value="server"),
+        app_commands.Choice(name="全体", value="global"),
+    ])
+    async def fishing_ranking(self, interaction: discord.Interaction, scope: str = "server"):
         await interaction.response.defer()
         
-        all_fish = []
-        ledger_data = self.bot.ledger.data
-        
-        for user_id_str, data in ledger_data.items():
-            inventory = data.get("fishing_inventory", [])
-            if not inventory:
-                continue
-            
-            try:
-                user_id = int(user_id_str)
-            except ValueError:
-                continue
-
-            for item in inventory:
-                all_fish.append({
-                    "name": item.get("name", "不明"),
-                    "size": item.get("size", 0),
-                    "owner_id": user_id
-                })
+        ledger = self.bot.ledger
+        members = self.bot.guild_members.scope(interaction.guild, scope)
+
+        if members is None:
+            # 全体は歴代記録の上位をそのまま使う
+            top = self.record_book().top(10)
+        else:
+            # 上位10匹の持ち主は必ず「自己ベスト」上位10人に含まれるため、その10人の自己ベストだけを調べる
+            top = heapq.nlargest(10, (
+                (user_id, name, size)
+                for user_id, _ in ledger.top_users("best_fish", limit=10, members=members)
+                for size, name, _, _ in ledger.peek_user(user_id).fishing_bests
+            ), key=lambda x: x[2])
+        all_fish = [{"name": name, "size": size, "owner_id": user_id} for user_id, name, size in top]
 
         if not all_fish:
             await interaction.followup.send("🌊 まだこの海に記録はない...")
             return
 
-        all_fish.sort(key=lambda x: x["size"], reverse=True)
-
-        embed = discord.Embed(title="🏆 歴代大物ランキング TOP10", color=discord.Color.gold())
+        scope_label = interaction.guild.name if members is not None else "全体"
+        embed = discord.Embed(title=f"🏆 歴代大物ランキング TOP10 ({scope_label})", color=discord.Color.gold())
         lines = []
+        names = await self.bot.names.resolve(interaction.guild, {fish["owner_id"] for fish in all_fish[:10]})
         
         for i, fish in enumerate(all_fish[:10], 1):
-            owner_id = fish["owner_id"]
-            member = interaction.guild.get_member(owner_id)
-            if member:
-                display_name = member.display_name
-            else:
-                user = self.bot.get_user(owner_id)
-                display_name = user.display_name if user else f"ユーザー({owner_id})"
-            
+            display_name = names[fish["owner_id"]]
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"`{i}.`"
             lines.append(f"{medal} **{display_name}** - {fish['name']} ({fish['size']} cm)")
 
         embed.description = "\n".join(lines)
         await interaction.followup.send(embed=embed)
 
+    @app_commands.command(name="fishing_records", description="魚の種類ごとの最大記録を表示します。")
+    async def fishing_records(self, interaction: discord.Interaction):
+        records = self.record_book().species_records()
+        if not records:
+            await interaction.response.send_message("📖 まだ記録は一つもない...", ephemeral=True)
+            return
+
+        await interaction.response.defer()
+        names = await self.bot.names.resolve(interaction.guild, {uid for _, _, uid in records})
+        embed = discord.Embed(title="📖 魚拓帳（種類別 最大記録）", color=discord.Color.teal())
+        embed.description = "\n".join(
+            f"**{name}**: {size} cm - {names[uid]}" for name, size, uid in records[:30]
+        )
+        embed.set_footer(text=f"記録済み: {len(records)} 種")
+        await interaction.followup.send(embed=embed)
+
+    @app_commands.command(name="fishing_reload", description="[管理者専用] 魚の図鑑・出現テーブルを再読み込みします。")
+    async def fishing_reload(self, interaction: discord.Interaction):
+        if interaction.user.id != ADMIN_ID:
+            await interaction.response.send_message("❌ このコマンドを実行する権限がありません。", ephemeral=True)
+            return
+        try:
+            species, pools = self.catalog.reload()
+        except Exception as e:
+            await interaction.response.send_message(f"❌ 再読み込みに失敗しました（現在の図鑑を維持します）: {e}", ephemeral=True)
+            return
+        await interaction.response.send_message(f"🔄 図鑑を再読み込みしました: {species} 種 / {pools} プール", ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(Fishing(bot))
@@ -4,6 +4,8 @@ from discord.ext import commands
 from datetime import datetime
 
 class Gallery(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot):
         self.bot = bot
 
@@ -22,17 +24,16 @@ class Gallery(commands.Cog):
             return
 
         # Ledgerに保存（全ユーザー共通のギャラリーにする場合）
-        if "image_gallery" not in self.bot.ledger.data:
-            self.bot.ledger.data["image_gallery"] = {}
+        gallery = self.bot.ledger.get_meta("image_gallery", {})
         
         # 既に名前が存在するかチェック
-        if name in self.bot.ledger.data["image_gallery"]:
+        if name in gallery:
             await interaction.followup.send(f"⚠️ 名前 `{name}` は既に使われています。別の名前にするか、削除してから保存してください。")
             return
 
         # 保存
-        self.bot.ledger.data["image_gallery"][name] = attachment.url
-        self.bot.ledger.save()
+        gallery[name] = attachment.url
+        self.bot.ledger.set_meta("image_gallery", gallery)
 
         embed = discord.Embed(
             title="📸 画像保存完了",
@@ -44,7 +45,7 @@ class Gallery(commands.Cog):
 
     @app_commands.command(name="img_load", description="保存された画像を名前で呼び出します")
     async def img_load(self, interaction: discord.Interaction, name: str):
-        gallery = self.bot.ledger.data.get("image_gallery", {})
+        gallery = self.bot.ledger.get_meta("image_gallery", {})
         url = gallery.get(name)
 
         if not url:
@@ -57,18 +58,18 @@ class Gallery(commands.Cog):
 
     @app_commands.command(name="img_del", description="保存された画像を削除します")
     async def img_del(self, interaction: discord.Interaction, name: str):
-        gallery = self.bot.ledger.data.get("image_gallery", {})
+        gallery = self.bot.ledger.get_meta("image_gallery", {})
         
         if name in gallery:
-            del self.bot.ledger.data["image_gallery"][name]
-            self.bot.ledger.save()
+            del gallery[name]
+            self.bot.ledger.set_meta("image_gallery", gallery)
             await interaction.response.send_message(f"✅ 画像 `{name}` を削除しました。")
         else:
             await interaction.response.send_message(f"❌ 名前 `{name}` は存在しません。", ephemeral=True)
 
     @app_commands.command(name="img_list", description="保存されている画像名の一覧を表示します")
     async def img_list(self, interaction: discord.Interaction):
-        gallery = self.bot.ledger.data.get("image_gallery", {})
+        gallery = self.bot.ledger.get_meta("image_gallery", {})
         
         if not gallery:
             await interaction.response.send_message("📁 ギャラリーは現在空です。")
@@ -74,5 +74,4 @@ class Ping(commands.Cog):
         await it.edit_original_response(content=None, embed=embed)
 
 async def setup(bot):
-    from __main__ import ledger_instance
-    await bot.add_cog(Ping(bot, ledger_instance))
+    await bot.add_cog(Ping(bot, bot.ledger))
@@ -5,7 +5,51 @@ from datetime import datetime, timedelta, timezone
 
 JST = timezone(timedelta(hours=9), 'JST')
 
+PAGE_SIZE = 10
+
+# カテゴリ → Ledgerのランキング項目
+CATEGORY_FIELDS = {"money": "money", "xp": "xp", "fishing": "best_fish", "study": "total_study_time"}
+
+class RankingView(discord.ui.View):
+    """ランキングのページ送りと、自分の順位へのジャンプを行うボタンUI。"""
+    def __init__(self, cog, category, page, members=None):
+        super().__init__(timeout=180)
+        self.cog = cog
+        self.category = category
+        self.page = page
+        self.members = members
+        self._sync_buttons()
+
+    def _sync_buttons(self):
+        self.prev_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= self.cog.page_count(self.category, self.members) - 1
+
+    async def _show(self, it: discord.Interaction, page):
+        self.page = page
+        self._sync_buttons()
+        # 名前の取得でREST呼び出しが発生し得るため、先に応答を保留する
+        await it.response.defer()
+        embed, chart = await self.cog.build_page(it.guild, self.category, page, self.members)
+        await it.edit_original_response(embed=embed, attachments=[chart] if chart else [], view=self)
+
+    @discord.ui.button(emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, it: discord.Interaction, button: discord.ui.Button):
+        await self._show(it, max(0, self.page - 1))
+
+    @discord.ui.button(emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_page(self, it: discord.Interaction, button: discord.ui.Button):
+        await self._show(it, min(self.cog.page_count(self.category, self.members) - 1, self.page + 1))
+
+    @discord.ui.button(label="自分の順位", emoji="📍", style=discord.ButtonStyle.primary)
+    async def my_rank(self, it: discord.Interaction, button: discord.ui.Button):
+        rank = self.cog.bot.ledger.rank_of(it.user.id, CATEGORY_FIELDS[self.category], self.members)
+        if rank is None:
+            return await it.response.send_message("⚠️ あなたはまだこのランキングに載っていません。", ephemeral=True)
+        await self._show(it, (rank - 1) // PAGE_SIZE)
+
 class Ranking(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot):
         self.bot = bot
 
@@ -16,70 +60,73 @@ class Ranking(commands.Cog):
         app_commands.Choice(name="釣り (最大サイズ)", value="fishing"),
         app_commands.Choice(name="学習 (累計時間)", value="study"),
     ])
-    async def ranking(self, it: discord.Interaction, category: str):
+    @app_commands.describe(scope="集計範囲（このサーバー / 全体）")
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="このサーバー", value="server"),
+        app_commands.Choice(name="全体", value="global"),
+    ])
+    async def ranking(self, it: discord.Interaction, category: str, scope: str = "server"):
         # 応答を保留（考え中状態にして3秒ルールを回避）
         await it.response.defer()
 
-        all_users = self.bot.ledger.data
-        if not all_users:
-            await it.followup.send("📊 まだデータが蓄積されていません。")
+        members = self.bot.guild_members.scope(it.guild, scope)
+        if not self.bot.ledger.ranked_count(CATEGORY_FIELDS[category], members):
+            await it.followup.send(f"⚠️ {category} のデータを持っているユーザーがいません。")
             return
 
-        ranking_data = []
+        view = RankingView(self, category, 0, members)
+        embed, chart = await self.build_page(it.guild, category, 0, members)
+        if chart:
+            await it.followup.send(embed=embed, file=chart, view=view)
+        else:
+            await it.followup.send(embed=embed, view=view)
 
-        # データ抽出ロジック
-        for uid_str, data in all_users.items():
-            try:
-                uid = int(uid_str)
-            except:
-                continue
+    def page_count(self, category, members=None):
+        return max(1, -(-self.bot.ledger.ranked_count(CATEGORY_FIELDS[category], members) // PAGE_SIZE))
 
-            val = 0
-            label = ""
+    async def build_page(self, guild, category, page, members=None):
+        """
+        指定ページのランキングEmbedと棒グラフ（discord.File、描画できない場合は None）を作ります。
+        全体は差分更新されるランキングから該当範囲のみ、サーバー単位はそのサーバーのメンバーの索引だけから求めます。
+        """
+        ledger = self.bot.ledger
+        field = CATEGORY_FIELDS[category]
 
+        lines = []
+        top = ledger.top_users(field, limit=PAGE_SIZE, offset=page * PAGE_SIZE, members=members)
+        names = await self.bot.names.resolve(guild, [uid for uid, _ in top])
+        for i, (uid, val) in enumerate(top, page * PAGE_SIZE + 1):
             if category == "money":
-                val = data.get("money", 0)
                 label = f"{val:,} cr"
             elif category == "xp":
-                val = data.get("xp", 0)
                 label = f"{val:,} xp"
             elif category == "fishing":
-                inventory = data.get("fishing_inventory", [])
-                if inventory:
-                    # 持っている魚の中で最大サイズを探す
-                    max_fish = max(inventory, key=lambda x: x["size"])
-                    val = max_fish["size"]
-                    label = f"{max_fish['name']} ({val} cm)"
-            elif category == "study":
-                val = data.get("total_study_time", 0)
+                # 自己ベスト（売却済みの獲物も含む）を表示
+                _, name, _, _ = ledger.peek_user(uid).fishing_bests[0]
+                label = f"{name} ({val} cm)"
+            else:
                 h, m = divmod(val, 60)
                 label = f"{h}h {m}m"
 
-            if val > 0:
-                ranking_data.append({"uid": uid, "val": val, "label": label})
-
-        if not ranking_data:
-            await it.followup.send(f"⚠️ {category} のデータを持っているユーザーがいません。")
-            return
-
-        # ソート（降順）
-        ranking_data.sort(key=lambda x: x["val"], reverse=True)
-
-        embed = discord.Embed(title=f"🏆 {category.capitalize()} ランキング", color=0xffd700)
-        
-        lines = []
-        for i, item in enumerate(ranking_data[:10], 1):
-            member = it.guild.get_member(item["uid"])
-            name = member.display_name if member else self.bot.get_user(item["uid"])
-            name = name if name else f"User_{str(item['uid'])[:4]}"
-            
+            name = names[uid]
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"`{i}.`"
-            lines.append(f"{medal} **{name}**: {item['label']}")
+            lines.append(f"{medal} **{name}**: {label}")
+
+        scope_label = guild.name if members is not None else "全体"
+        embed = discord.Embed(title=f"🏆 {category.capitalize()} ランキング ({scope_label})", color=0xffd700)
+        embed.description = "\n".join(lines) if lines else "このページには記録がありません。"
+        embed.set_footer(text=f"Rb m/25 Ranking System | Page {page + 1}/{self.page_count(category, members)}")
 
-        embed.description = "\n".join(lines)
-        embed.set_footer(text="Rb m/25 Ranking System")
-        
-        await it.followup.send(embed=embed)
+        chart = None
+        if top:
+            unit = {"money": "cr", "xp": "xp", "fishing": "cm", "study": "h"}[category]
+            rows = [[names[uid], round(val / 60, 1) if category == "study" else val] for uid, val in top]
+            chart = await self.bot.charts.render_file(
+                "ranking", {"title": f"{category.capitalize()} Ranking", "unit": unit, "rows": rows}, filename="ranking.png"
+            )
+            if chart:
+                embed.set_image(url="attachment://ranking.png")
+        return embed, chart
 
 async def setup(bot):
     await bot.add_cog(Ranking(bot))
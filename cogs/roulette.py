@@ -62,5 +62,4 @@ class Roulette(commands.Cog):
         await it.edit_original_response(embed=result_embed)
 
 async def setup(bot):
-    from __main__ import ledger_instance
-    await bot.add_cog(Roulette(bot, ledger_instance))
+    await bot.add_cog(Roulette(bot, bot.ledger))
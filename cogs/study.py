@@ -1,77 +1,270 @@
 import discord
+import time
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from datetime import datetime, timedelta, timezone
+from charts import study_heatmap_data
+from studylog import SPANS, StudyBoards, history_total
 
 # タイムゾーン設定
 JST = timezone(timedelta(hours=9), 'JST')
 
+# 1回の学習として記録する上限（分）。不正・放置対策
+MAX_SESSION_MINUTES = 720
+# 自習用ボイスチャンネルの設定（Ledgerのメタデータ: {サーバーID: [チャンネルID, ...]}）
+VOICE_CHANNELS_KEY = "study_voice_channels"
+# 進行中のボイス学習のチェックポイント（{"サーバーID:ユーザーID": [開始時刻, 最後に在室を確認した時刻]}）
+VOICE_SESSIONS_KEY = "study_voice_sessions"
+# 在室確認・チェックポイント保存の間隔（分）
+SWEEP_MINUTES = 5
+
+def apply_study_reward(user_data, day, minutes):
+    """学習時間を記録し、報酬（1分につき1xp / 2分につき1cr）を付与します。付与したcrを返します。"""
+    user_data.add_study(day, minutes)
+    reward_cr = minutes // 2
+    user_data.money += reward_cr
+    user_data.xp += minutes
+    return reward_cr
+
 class Study(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot):
         self.bot = bot
+        # 期間別ランキング（初回利用時にLedgerから読み込む）
+        self.boards = None
+        # 自習用ボイスチャンネルでの学習: (サーバーID, ユーザーID) → [開始時刻, 最後に在室を確認した時刻]（UNIX秒）
+        self.voice_sessions = {}
+        self._sessions_saved = False
+
+    async def cog_load(self):
+        self.sweep_sessions.start()
+
+    async def cog_unload(self):
+        self.sweep_sessions.cancel()
+
+    def study_boards(self):
+        """期間別ランキングを今日の日付まで進めて返します。保存された集計が無ければ各ユーザーの記録から作り直します。"""
+        today = datetime.now(JST).date().toordinal()
+        if self.boards is None:
+            ledger = self.bot.ledger
+            saved = ledger.get_meta(StudyBoards.META_KEY)
+            if saved:
+                self.boards = StudyBoards.from_dict(saved, today)
+            else:
+                self.boards = StudyBoards.rebuild(ledger.users(), today)
+                print(f"📚 Study window rankings rebuilt ({len(self.boards.totals['monthly'])} users)")
+        self.boards.advance(today)
+        return self.boards
+
+    def note_study(self, user_id, day, minutes):
+        """期間別ランキングへ学習時間を加え、保存対象にします。"""
+        boards = self.study_boards()
+        boards.add(user_id, day.toordinal(), minutes)
+        if self.bot.ledger.writable:
+            self.bot.ledger.set_meta(StudyBoards.META_KEY, boards.to_dict())
+
+    # --- [VOICE SESSIONS] ---
+    def study_channels(self, guild_id):
+        return set(self.bot.ledger.get_meta(VOICE_CHANNELS_KEY, {}).get(str(guild_id), []))
+
+    def in_study_channel(self, state):
+        """ボイス状態が自習用チャンネルへの在室を表すかどうか。"""
+        channel = state.channel if state else None
+        return channel is not None and channel.id in self.study_channels(channel.guild.id)
+
+    def voice_session_of(self, user_id):
+        return next((key for key in self.voice_sessions if key[1] == user_id), None)
+
+    def start_session(self, guild_id, user_id):
+        # 手動の学習記録が進行中の場合は二重に数えないよう、そちらを優先する
+        if self.bot.ledger.peek_user(user_id).is_studying or self.voice_session_of(user_id):
+            return
+        now = time.time()
+        self.voice_sessions[(guild_id, user_id)] = [now, now]
+
+    async def close_session(self, key, end_ts, reason):
+        """セッションを終了し、開始から end_ts までの学習時間を手動の記録と同じ方法で反映します。"""
+        start_ts, _ = self.voice_sessions.pop(key)
+        minutes = min(int((end_ts - start_ts) / 60), MAX_SESSION_MINUTES)
+        if minutes < 1:
+            return 0
+        end_day = datetime.fromtimestamp(end_ts, JST).date()
+        self.study_boards()
+        async with self.bot.ledger.transaction(key[1]) as user_data:
+            apply_study_reward(user_data, end_day, minutes)
+        self.note_study(key[1], end_day, minutes)
+        print(f"🎧 Voice Study: {key[1]} {minutes}分を記録しました（{reason}）")
+        return minutes
+
+    def checkpoint_sessions(self):
+        """進行中のセッションをLedgerへ保存します（再起動しても学習時間を失わないため）。"""
+        if not self.bot.ledger.writable or (not self.voice_sessions and not self._sessions_saved):
+            return
+        saved = {f"{g}:{u}": list(times) for (g, u), times in self.voice_sessions.items()}
+        self.bot.ledger.set_meta(VOICE_SESSIONS_KEY, saved or None)
+        self._sessions_saved = bool(saved)
+
+    async def restore_sessions(self):
+        """
+        起動時に、保存されたセッションを引き継ぎます。まだ在室していれば続きから、
+        退室済みなら最後に在室を確認した時刻までを記録します。また在室中で未記録のメンバーの記録を開始します。
+        """
+        for key_str, (start_ts, seen_ts) in self.bot.ledger.get_meta(VOICE_SESSIONS_KEY, {}).items():
+            guild_id, user_id = map(int, key_str.split(":"))
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(user_id) if guild else None
+            self.voice_sessions[(guild_id, user_id)] = [start_ts, seen_ts]
+            if member is None or not self.in_study_channel(member.voice):
+                try:
+                    await self.close_session((guild_id, user_id), seen_ts, "再起動前に退室")
+                except Exception as e:
+                    print(f"❌ Voice Study Error: {e}")
+
+        for guild in self.bot.guilds:
+            for channel_id in self.study_channels(guild.id):
+                channel = guild.get_channel(channel_id)
+                for member in getattr(channel, "members", []):
+                    if not member.bot and (guild.id, member.id) not in self.voice_sessions:
+                        self.start_session(guild.id, member.id)
+        self._sessions_saved = True
+        self.checkpoint_sessions()
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.bot or not self.bot.ledger or not self.bot.ledger.writable:
+            return
+        key = (member.guild.id, member.id)
+        joined = self.in_study_channel(after)
+        if joined and key not in self.voice_sessions:
+            self.start_session(*key)
+        elif not joined and key in self.voice_sessions:
+            try:
+                await self.close_session(key, time.time(), "退室")
+            except Exception as e:
+                print(f"❌ Voice Study Error: {e}")
+            self.checkpoint_sessions()
+
+    @tasks.loop(minutes=SWEEP_MINUTES)
+    async def sweep_sessions(self):
+        """
+        すべてのセッションを1つのタスクでまとめて確認します。退室を取りこぼしたものは終了し、上限を超えたものは
+        記録して新しいセッションを開始します。在室中のものは確認時刻を更新してチェックポイントを保存します。
+        """
+        if not self.bot.ledger.writable:
+            return
+        now = time.time()
+        for key, (start_ts, seen_ts) in list(self.voice_sessions.items()):
+            guild = self.bot.get_guild(key[0])
+            member = guild.get_member(key[1]) if guild else None
+            try:
+                if member is None or not self.in_study_channel(member.voice):
+                    await self.close_session(key, seen_ts, "退室を検出")
+                elif now - start_ts >= MAX_SESSION_MINUTES * 60:
+                    await self.close_session(key, now, "上限時間に到達")
+                    # まだ在室しているため、続きは新しいセッションとして記録する
+                    self.start_session(*key)
+                else:
+                    self.voice_sessions[key][1] = now
+            except Exception as e:
+                print(f"❌ Voice Study Error: {e}")
+        self.checkpoint_sessions()
+
+    @sweep_sessions.before_loop
+    async def before_sweep_sessions(self):
+        await self.bot.wait_until_ready()
+        if self.bot.ledger and await self.bot.ledger.wait_ready():
+            await self.restore_sessions()
+
+    @app_commands.command(name="study_channel", description="自習用ボイスチャンネル（在室中の時間を自動で学習記録）を登録・解除します")
+    @app_commands.describe(channel="登録・解除するボイスチャンネル（未指定で一覧を表示）")
+    @app_commands.checks.has_permissions(manage_guild=True)
+    async def study_channel(self, interaction: discord.Interaction, channel: discord.VoiceChannel = None):
+        config = dict(self.bot.ledger.get_meta(VOICE_CHANNELS_KEY, {}))
+        channels = set(config.get(str(interaction.guild.id), []))
+        if channel is None:
+            listed = "\n".join(f"<#{cid}>" for cid in channels) or "登録されていません。"
+            await interaction.response.send_message(f"🎧 自習用ボイスチャンネル:\n{listed}", ephemeral=True)
+            return
+
+        if channel.id in channels:
+            channels.discard(channel.id)
+            message = f"🔕 {channel.mention} を自習用チャンネルから解除しました。"
+        else:
+            channels.add(channel.id)
+            message = f"🎧 {channel.mention} を自習用チャンネルに登録しました。在室中の時間が自動で学習記録されます。"
+        if channels:
+            config[str(interaction.guild.id)] = sorted(channels)
+        else:
+            config.pop(str(interaction.guild.id), None)
+        self.bot.ledger.set_meta(VOICE_CHANNELS_KEY, config or None)
+        await interaction.response.send_message(message, ephemeral=True)
 
+    # --- [COMMANDS] ---
     @app_commands.command(name="study_start", description="学習を開始します")
     async def study_start(self, interaction: discord.Interaction):
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        
-        if user_data.get("is_studying"):
-            await interaction.response.send_message("⚠️ すでに学習記録が進行中です！", ephemeral=True)
+        if self.voice_session_of(interaction.user.id):
+            await interaction.response.send_message("🎧 自習用ボイスチャンネルでの学習を自動で記録中です！退室すると記録されます。", ephemeral=True)
             return
+        async with self.bot.ledger.transaction(interaction.user.id) as user_data:
+            already = user_data.is_studying
+            if not already:
+                user_data.is_studying = True
+                user_data.study_start_time = datetime.now(JST).isoformat()
 
-        user_data["is_studying"] = True
-        user_data["study_start_time"] = datetime.now(JST).isoformat()
-        self.bot.ledger.save()
+        if already:
+            await interaction.response.send_message("⚠️ すでに学習記録が進行中です！", ephemeral=True)
+            return
         
         await interaction.response.send_message(f"📚 {interaction.user.display_name}さん、学習を開始しました！集中していきましょう。")
 
     @app_commands.command(name="study_end", description="学習を終了します")
     async def study_end(self, interaction: discord.Interaction):
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        
-        if not user_data.get("is_studying"):
+        if not self.bot.ledger.peek_user(interaction.user.id).is_studying:
             await interaction.response.send_message("⚠️ 学習開始の記録が見つかりません。`/study_start` を先に実行してください。", ephemeral=True)
             return
 
-        # 時間計算
-        try:
-            start_time = datetime.fromisoformat(user_data["study_start_time"])
-        except (KeyError, ValueError):
-            user_data["is_studying"] = False
-            self.bot.ledger.save()
-            return await interaction.response.send_message("❌ 開始時間のデータが破損していました。リセットしました。", ephemeral=True)
+        # 期間別ランキングは記録の更新前に読み込んでおく（作り直しの際に今回の分を二重に数えないため）
+        self.study_boards()
+        # 二重実行で報酬が重複しないよう、学習中フラグの確認から更新までをロック内で行う
+        async with self.bot.ledger.transaction(interaction.user.id) as user_data:
+            if not user_data.is_studying:
+                outcome = "missing"
+            else:
+                user_data.is_studying = False
+                # 時間計算
+                try:
+                    start_time = datetime.fromisoformat(user_data.study_start_time)
+                except (TypeError, ValueError):
+                    outcome = "broken"
+                else:
+                    end_time = datetime.now(JST)
+                    duration = end_time - start_time
+                    minutes = int(duration.total_seconds() / 60)
 
-        end_time = datetime.now(JST)
-        duration = end_time - start_time
-        minutes = int(duration.total_seconds() / 60)
+                    # 不正・放置対策 (最大12時間 = 720分)
+                    if minutes > MAX_SESSION_MINUTES:
+                        minutes = MAX_SESSION_MINUTES
+                        over_notice = "\n⚠️ 12時間を超える記録のため、上限の720分として処理されました。"
+                    else:
+                        over_notice = ""
 
-        # 不正・放置対策 (最大12時間 = 720分)
-        if minutes > 720:
-            minutes = 720
-            over_notice = "\n⚠️ 12時間を超える記録のため、上限の720分として処理されました。"
-        else:
-            over_notice = ""
+                    if minutes < 1:
+                        outcome = "short"
+                    else:
+                        outcome = "done"
+                        # データの更新と報酬 (1分につき1xp / 2分につき1cr)
+                        reward_cr = apply_study_reward(user_data, end_time.date(), minutes)
 
-        if minutes < 1:
-            user_data["is_studying"] = False
-            self.bot.ledger.save()
+        if outcome == "missing":
+            await interaction.response.send_message("⚠️ 学習開始の記録が見つかりません。`/study_start` を先に実行してください。", ephemeral=True)
+            return
+        if outcome == "broken":
+            return await interaction.response.send_message("❌ 開始時間のデータが破損していました。リセットしました。", ephemeral=True)
+        if outcome == "short":
             await interaction.response.send_message("⏱️ 1分未満の学習は記録されません。また頑張りましょう！")
             return
-
-        # データの更新
-        today = end_time.strftime("%Y-%m-%d")
-        history = user_data.get("study_history", {})
-        history[today] = history.get(today, 0) + minutes
-        
-        user_data["study_history"] = history
-        user_data["total_study_time"] = user_data.get("total_study_time", 0) + minutes
-        user_data["is_studying"] = False
-        
-        # 報酬設定 (1分につき1xp / 2分につき1cr)
-        reward_cr = minutes // 2
-        user_data["money"] = user_data.get("money", 0) + reward_cr
-        user_data["xp"] = user_data.get("xp", 0) + minutes
-        
-        self.bot.ledger.save()
+        self.note_study(interaction.user.id, end_time.date(), minutes)
 
         h, m = divmod(minutes, 60)
         time_str = f"{h}時間{m}分" if h > 0 else f"{m}分"
@@ -83,12 +276,15 @@ class Study(commands.Cog):
 
     @app_commands.command(name="study_stats", description="自分の学習統計を表示します")
     async def study_stats(self, interaction: discord.Interaction):
-        user_data = self.bot.ledger.get_user(interaction.user.id)
-        total_min = user_data.get("total_study_time", 0)
-        history = user_data.get("study_history", {})
+        user_data = self.bot.ledger.peek_user(interaction.user.id)
+        total_min = user_data.total_study_time
+        history = user_data.study_history
         
-        today = datetime.now(JST).strftime("%Y-%m-%d")
-        today_min = history.get(today, 0)
+        today = datetime.now(JST).date().toordinal()
+        today_min = user_data.study_recent.total(today, SPANS["daily"])
+        week_min = user_data.study_recent.total(today, SPANS["weekly"])
+        # 日別・月別・年別の記録が混在していても、今年に含まれるものをすべて合計する
+        year_min = history_total(history, str(datetime.now(JST).year))
 
         embed = discord.Embed(
             title=f"📊 {interaction.user.display_name} の学習報告書", 
@@ -97,79 +293,80 @@ class Study(commands.Cog):
         )
         
         # 現在の学習状況を表示
-        if user_data.get("is_studying"):
+        if user_data.is_studying:
             try:
-                st = datetime.fromisoformat(user_data["study_start_time"])
+                st = datetime.fromisoformat(user_data.study_start_time)
                 now_min = int((datetime.now(JST) - st).total_seconds() / 60)
                 embed.add_field(name="✍️ 現在学習中", value=f"経過時間: **{now_min}分**", inline=False)
             except: pass
+        session = self.voice_session_of(interaction.user.id)
+        if session:
+            now_min = int((time.time() - self.voice_sessions[session][0]) / 60)
+            embed.add_field(name="🎧 ボイスチャンネルで学習中", value=f"経過時間: **{now_min}分**", inline=False)
 
         th, tm = divmod(today_min, 60)
         all_h, all_m = divmod(total_min, 60)
         
+        wh, wm = divmod(week_min, 60)
+        
         embed.add_field(name="📅 本日の記録", value=f"{th}時間{tm}分" if th > 0 else f"{tm}分", inline=True)
+        embed.add_field(name="🗓️ 直近7日間", value=f"{wh}時間{wm}分" if wh > 0 else f"{wm}分", inline=True)
+        embed.add_field(name="🗓️ 今年の記録", value=f"{year_min // 60}時間{year_min % 60}分", inline=True)
         embed.add_field(name="🏛️ 累計学習時間", value=f"{all_h}時間{all_m}分", inline=True)
         
         embed.set_footer(text="Rb m/25E 教育支援システム")
-        await interaction.response.send_message(embed=embed)
+
+        if not history:
+            await interaction.response.send_message(embed=embed)
+            return
+
+        # 直近12週の学習ヒートマップ（描画は別プロセス、同じ内容なら描画済みの画像を再利用）
+        await interaction.response.defer()
+        data = study_heatmap_data(history, datetime.now(JST).date(), title="Study minutes (last 12 weeks)")
+        chart = await self.bot.charts.render_file("study_heatmap", data, filename="study.png")
+        if chart:
+            embed.set_image(url="attachment://study.png")
+            await interaction.followup.send(embed=embed, file=chart)
+        else:
+            await interaction.followup.send(embed=embed)
 
     @app_commands.command(name="study_ranking", description="学習時間のランキングを表示します")
-    @app_commands.describe(span="表示する期間（daily, weekly, monthly, total）")
-    async def study_ranking(self, interaction: discord.Interaction, span: str = "total"):
+    @app_commands.describe(span="表示する期間（daily, weekly, monthly, total）", scope="集計範囲（このサーバー / 全体）")
+    @app_commands.choices(scope=[
+        app_commands.Choice(name="このサーバー", value="server"),
+        app_commands.Choice(name="全体", value="global"),
+    ])
+    async def study_ranking(self, interaction: discord.Interaction, span: str = "total", scope: str = "server"):
         await interaction.response.defer()
 
         if span not in ["daily", "weekly", "monthly", "total"]:
             return await interaction.followup.send("❌ 引数は daily, weekly, monthly, total から選択してください。")
 
-        ranking_data = []
         now = datetime.now(JST)
-        
-        # main.pyの設計に合わせ .data["users"] を参照
-        users_dict = self.bot.ledger.data.get("users", {})
-
-        for user_id_str, data in users_dict.items():
-            try:
-                user_id = int(user_id_str)
-            except ValueError: continue
+        members = self.bot.guild_members.scope(interaction.guild, scope)
 
-            time_val = 0
-            if span == "total":
-                time_val = data.get("total_study_time", 0)
-            else:
-                history = data.get("study_history", {})
-                for date_str, minutes in history.items():
-                    try:
-                        log_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                        target_date = now.date()
-                        diff = (target_date - log_date).days
-                        
-                        if span == "daily" and diff == 0:
-                            time_val += minutes
-                        elif span == "weekly" and diff < 7:
-                            time_val += minutes
-                        elif span == "monthly" and diff < 30:
-                            time_val += minutes
-                    except ValueError: continue
-            
-            if time_val > 0:
-                ranking_data.append({"user_id": user_id, "time": time_val})
+        if span == "total":
+            # 累計は保存先の索引から上位のみを取得する
+            top = self.bot.ledger.top_users("total_study_time", limit=10, members=members)
+        else:
+            # 日・週・月は差分更新される期間別ランキングから上位のみを取得する
+            top = self.study_boards().top(span, limit=10, members=members)
+        ranking_data = [{"user_id": user_id, "time": time_val} for user_id, time_val in top]
 
         if not ranking_data:
             return await interaction.followup.send(f"⚠️ {span} の有効なランキングデータがありません。")
 
-        ranking_data.sort(key=lambda x: x["time"], reverse=True)
-
+        scope_label = interaction.guild.name if members is not None else "全体"
         embed = discord.Embed(
-            title=f"🏆 学習ランキング [{span.upper()}]",
+            title=f"🏆 学習ランキング [{span.upper()}] ({scope_label})",
             color=0xffd700,
             timestamp=now
         )
 
         desc = ""
+        names = await self.bot.names.resolve(interaction.guild, [item["user_id"] for item in ranking_data[:10]])
         for i, item in enumerate(ranking_data[:10], 1):
-            user_id = item["user_id"]
-            member = interaction.guild.get_member(user_id)
-            name = member.display_name if member else f"User({user_id})"
+            name = names[item["user_id"]]
 
             h, m = divmod(item["time"], 60)
             time_str = f"{h}h {m}m" if h > 0 else f"{m}m"
@@ -3,12 +3,15 @@ from discord.ext import commands
 from discord import app_commands
 from datetime import datetime, timedelta, timezone
 import re
+from records import UserRecord
 
 # システム定数
 MAIN_GUILD_ID = 1372567395419291698
 ADMIN_ID = 840821281838202880
 
 class User(commands.Cog):
+    uses_ledger = True
+
     def __init__(self, bot, ledger):
         self.bot = bot
         self.ledger = ledger
@@ -95,7 +98,7 @@ class User(commands.Cog):
             full_user = user_obj
 
         # 2. 資産データ連携
-        u_data = self.ledger.get_user(user_obj.id) if self.ledger else {"money": 0, "xp": 0}
+        u_data = self.ledger.peek_user(user_obj.id) if self.ledger else UserRecord(money=0)
 
         # 3. 視覚設計（アクセントカラー優先）
         accent_color = full_user.accent_color if hasattr(full_user, 'accent_color') and full_user.accent_color else 0x4C566A
@@ -188,7 +191,7 @@ class User(commands.Cog):
             embed.add_field(name="🚀 リアルタイム活動", value="⚠️ 共通サーバー外のため非可視", inline=False)
 
         # --- D: 資産 & メディア ---
-        resource_val = f"**所持金**: `{u_data.get('money', 0):,} cr` | **経験値**: `{u_data.get('xp', 0):,} xp`"
+        resource_val = f"**所持金**: `{u_data.money:,} cr` | **経験値**: `{u_data.xp:,} xp`"
         embed.add_field(name="💎 資産データ", value=resource_val, inline=False)
 
         links = [f"[アイコン]({full_user.display_avatar.url})"]
@@ -208,6 +211,4 @@ class User(commands.Cog):
         await it.followup.send(embed=embed, ephemeral=is_ephemeral)
 
 async def setup(bot):
-    # ledger_instanceはmain.pyで定義されている前提
-    from __main__ import ledger_instance
-    await bot.add_cog(User(bot, ledger_instance))
+    await bot.add_cog(User(bot, bot.ledger))
@@ -0,0 +1,128 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+JST = timezone(timedelta(hours=9), 'JST')
+
+# 釣り場の表示名
+LOCATIONS = {"sea": "海", "river": "川"}
+
+# レア度の序列（低い順）
+RARITY_ORDER = ("ゴミ", "N", "R", "SR", "SSR", "LEGEND", "TREASURE")
+
+
+class AliasSampler:
+    """
+    Walker/Vose のエイリアス法による重み付き抽選。表の構築は O(n)、1回の抽選は O(1) です。
+    """
+    __slots__ = ("_prob", "_alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("重みの合計は正である必要があります")
+        scaled = [w * n / total for w in weights]
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 残りは丸め誤差分のみ（確率1として扱う）
+
+    @property
+    def table(self):
+        """(確率表, エイリアス表)。一括抽選（ベクトル化）で同じ表を使うためのものです。"""
+        return tuple(self._prob), tuple(self._alias)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+    def sample_many(self, k, rng=random):
+        """k 回分の抽選をまとめて行います（表の参照をローカルに束ねた1回のループ）。"""
+        prob, alias, n, r = self._prob, self._alias, len(self._prob), rng.random
+        return [i if r() < prob[i] else alias[i] for i in (int(r() * n) for _ in range(k))]
+
+
+class FishPool:
+    """1つの出現テーブル（釣り場・時間帯・イベントの条件と、種ごとの重み）。"""
+
+    def __init__(self, spec, species):
+        self.id = spec["id"]
+        self.location = spec.get("location", "sea")
+        self.hours = tuple(spec["hours"]) if "hours" in spec else None
+        self.event = spec.get("event")
+        unknown = set(spec["weights"]) - set(species)
+        if unknown:
+            raise ValueError(f"プール {self.id} に未定義の種があります: {', '.join(sorted(unknown))}")
+        self.species_ids = list(spec["weights"])
+        self.weights = [float(spec["weights"][sid]) for sid in self.species_ids]
+        self.sampler = AliasSampler(self.weights)
+
+    def matches(self, location, now):
+        if location != self.location:
+            return False
+        if self.hours:
+            start, end = self.hours
+            hour = now.hour
+            # 19時～5時のように日をまたぐ時間帯にも対応する
+            if not (start <= hour < end if start < end else hour >= start or hour < end):
+                return False
+        if self.event:
+            today = now.strftime("%m-%d")
+            start, end = self.event["start"], self.event["end"]
+            if not (start <= today <= end if start <= end else today >= start or today <= end):
+                return False
+        return True
+
+    @property
+    def specificity(self):
+        """条件の多いプールほど優先する（イベント > 時間帯 > 基本）。"""
+        return (2 if self.event else 0) + (1 if self.hours else 0)
+
+
+class FishCatalog:
+    """
+    データファイル（fish_catalog.json）から読み込む魚の図鑑と出現テーブル。
+    各プールのエイリアス表は読み込み時に1回だけ構築し、reload() で作り直します。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.species = {}
+        self.pools = []
+        self.reload()
+
+    def reload(self):
+        """データファイルを読み直して表を作り直します。失敗した場合は現在の表を維持して例外を送出します。"""
+        with open(self.path, encoding="utf-8") as f:
+            spec = json.load(f)
+        species = {}
+        for sid, info in spec["species"].items():
+            species[sid] = dict(info, id=sid, size_range=tuple(info["size_range"]))
+        pools = [FishPool(p, species) for p in spec["pools"]]
+        # すべての読み込みが成功してから差し替える
+        self.species = species
+        self.pools = pools
+        return len(species), len(pools)
+
+    def pool_for(self, location, now=None):
+        """釣り場と現在時刻（JST）に合うプールのうち、最も条件の細かいものを返します。"""
+        now = now or datetime.now(JST)
+        candidates = [p for p in self.pools if p.matches(location, now)]
+        if not candidates:
+            raise KeyError(location)
+        return max(candidates, key=lambda p: p.specificity)
+
+    def cast_many(self, location, k, now=None, rng=random):
+        """k 回分の獲物のリストと、抽選に使ったプールを返します（プールの選択は1回だけ）。"""
+        pool = self.pool_for(location, now)
+        ids = pool.species_ids
+        return [self.species[ids[i]] for i in pool.sampler.sample_many(k, rng)], pool
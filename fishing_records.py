@@ -0,0 +1,70 @@
+from sortedcontainers import SortedList
+
+
+class FishRecordBook:
+    """
+    釣りの歴代記録（生け簀とは別に保持し、売却しても消えません）。
+    - 全体の大物 上位 limit 匹: (-サイズ, 釣った時刻, ユーザーID, 名前, レア度) の順序付きリスト
+    - 種ごとの最大記録: 名前 → [サイズ, ユーザーID, 釣った時刻]
+    ユーザーごとの自己ベストは UserRecord.fishing_bests に保持します。
+    1匹ごとの更新は O(log n) で、ランキングは各ユーザーの生け簀を一切走査しません。
+    """
+    META_KEY = "fishing_records"
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self._top = SortedList()
+        self.species = {}
+
+    def note(self, uid, name, rarity, size, ts):
+        """
+        釣った獲物を記録に照らし合わせ、(全体順位 または None, 種の新記録かどうか) を返します。
+        どちらにも当てはまらない場合は記録を変更しません。
+        """
+        rank = None
+        entry = (-size, int(ts), int(uid), name, rarity)
+        if len(self._top) < self.limit or entry < self._top[-1]:
+            self._top.add(entry)
+            rank = self._top.index(entry) + 1
+            if len(self._top) > self.limit:
+                self._top.pop()
+
+        current = self.species.get(name)
+        species_record = current is None or size > current[0]
+        if species_record:
+            self.species[name] = [size, int(uid), int(ts)]
+        return rank, species_record
+
+    def top(self, limit=10):
+        """[(ユーザーID, 名前, サイズ), ...] を大きい順に返します。"""
+        return [(uid, name, -neg) for neg, _, uid, name, _ in self._top.islice(0, limit)]
+
+    def species_records(self):
+        """[(名前, サイズ, ユーザーID), ...] をサイズの大きい順に返します。"""
+        return sorted(((name, size, uid) for name, (size, uid, _) in self.species.items()),
+                      key=lambda r: r[1], reverse=True)
+
+    # --- [SERIALIZATION] ---
+    def to_dict(self):
+        return {
+            "top": [[-neg, ts, uid, name, rarity] for neg, ts, uid, name, rarity in self._top],
+            "species": {name: list(entry) for name, entry in self.species.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d, limit=100):
+        book = cls(limit)
+        book._top = SortedList((-size, ts, uid, name, rarity) for size, ts, uid, name, rarity in d.get("top", []))
+        while len(book._top) > limit:
+            book._top.pop()
+        book.species = {name: list(entry) for name, entry in d.get("species", {}).items()}
+        return book
+
+    @classmethod
+    def rebuild(cls, users, limit=100):
+        """記録がまだ無い場合に、各ユーザーの自己ベスト（(ユーザーID, レコード) の列）から作ります。"""
+        book = cls(limit)
+        for uid, record in users:
+            for size, name, rarity, ts in record.fishing_bests:
+                book.note(uid, name, rarity, size, ts)
+        return book
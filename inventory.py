@@ -0,0 +1,225 @@
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+# 1匹分の獲物（表示・集計用の読み取り専用ビュー）
+FishItem = namedtuple("FishItem", "id name rarity size price ts")
+
+
+class FishInventory:
+    """
+    生け簀（獲物の所持品）のコンパクトな表現。
+    - 種コード表: (名前, レア度) の一覧。各獲物はその番号だけを持つ
+    - 並列配列: ID・種コード・サイズ・価格・釣った時刻（UNIX秒）
+    各獲物には削除しても変わらない安定したIDを振り、売却は O(1) で墓標（ID=0）を立てます。
+    種・レア度ごとの数と合計額は追加・削除のたびに差分で更新します。
+    """
+    __slots__ = (
+        "next_id", "codes", "_code_index",
+        "ids", "species", "sizes", "prices", "times",
+        "_pos", "_dead", "_count", "_value", "_species_totals",
+    )
+
+    def __init__(self):
+        self.next_id = 1
+        self.codes = []
+        self._code_index = {}
+        self.ids = array("q")
+        self.species = array("l")
+        self.sizes = array("d")
+        self.prices = array("q")
+        self.times = array("q")
+        self._pos = {}
+        self._dead = 0
+        self._count = 0
+        self._value = 0
+        # 種コード → [数, 合計額]
+        self._species_totals = []
+
+    # --- [MUTATION] ---
+    def _code(self, name, rarity):
+        key = (name, rarity)
+        code = self._code_index.get(key)
+        if code is None:
+            code = len(self.codes)
+            self.codes.append(key)
+            self._code_index[key] = code
+            self._species_totals.append([0, 0])
+        return code
+
+    def add(self, name, rarity, size, price, ts=None, item_id=None):
+        """獲物を追加し、そのIDを返します。"""
+        if item_id is None:
+            item_id = self.next_id
+        self.next_id = max(self.next_id, item_id + 1)
+        code = self._code(name, rarity)
+        self._pos[item_id] = len(self.ids)
+        self.ids.append(item_id)
+        self.species.append(code)
+        self.sizes.append(size)
+        self.prices.append(price)
+        self.times.append(int(ts if ts is not None else datetime.now().timestamp()))
+
+        totals = self._species_totals[code]
+        totals[0] += 1
+        totals[1] += price
+        self._count += 1
+        self._value += price
+        return item_id
+
+    def _kill(self, i):
+        """位置 i の獲物に墓標を立て、集計から差し引きます。"""
+        del self._pos[self.ids[i]]
+        price = self.prices[i]
+        totals = self._species_totals[self.species[i]]
+        totals[0] -= 1
+        totals[1] -= price
+        self._count -= 1
+        self._value -= price
+        self.ids[i] = 0
+        self._dead += 1
+
+    def _maybe_compact(self):
+        # 墓標が生きている獲物より多くなったら詰め直す（ならし O(1)）
+        if self._dead > 32 and self._dead > self._count:
+            self._compact()
+
+    def remove(self, item_id):
+        """指定IDの獲物を取り除いて返します（存在しない場合は None）。"""
+        i = self._pos.get(item_id)
+        if i is None:
+            return None
+        item = self._item(i)
+        self._kill(i)
+        self._maybe_compact()
+        return item
+
+    def remove_where(self, predicate):
+        """predicate(FishItem) が真になる獲物を1回の走査でまとめて取り除き、そのリストを返します。"""
+        removed = []
+        for i in range(len(self.ids)):
+            if not self.ids[i]:
+                continue
+            item = self._item(i)
+            if predicate(item):
+                self._kill(i)
+                removed.append(item)
+        self._maybe_compact()
+        return removed
+
+    def clear(self):
+        """すべての獲物を取り除き、(数, 合計額) を返します。IDの採番は継続します。"""
+        result = (self._count, self._value)
+        next_id = self.next_id
+        self.__init__()
+        self.next_id = next_id
+        return result
+
+    def _compact(self):
+        alive = [i for i in range(len(self.ids)) if self.ids[i]]
+        self.ids = array("q", (self.ids[i] for i in alive))
+        self.species = array("l", (self.species[i] for i in alive))
+        self.sizes = array("d", (self.sizes[i] for i in alive))
+        self.prices = array("q", (self.prices[i] for i in alive))
+        self.times = array("q", (self.times[i] for i in alive))
+        self._pos = {item_id: i for i, item_id in enumerate(self.ids)}
+        self._dead = 0
+
+    # --- [QUERIES] ---
+    def _item(self, i):
+        name, rarity = self.codes[self.species[i]]
+        return FishItem(self.ids[i], name, rarity, self.sizes[i], self.prices[i], self.times[i])
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        """獲物を古い順に返します。"""
+        for i in range(len(self.ids)):
+            if self.ids[i]:
+                yield self._item(i)
+
+    def get(self, item_id):
+        i = self._pos.get(item_id)
+        return None if i is None else self._item(i)
+
+    def latest(self, n):
+        """新しい順に最大 n 匹を返します（末尾から辿るだけで全体は走査しません）。"""
+        result = []
+        i = len(self.ids) - 1
+        while i >= 0 and len(result) < n:
+            if self.ids[i]:
+                result.append(self._item(i))
+            i -= 1
+        return result
+
+    @property
+    def total_value(self):
+        return self._value
+
+    def by_species(self):
+        """{(名前, レア度): (数, 合計額)}（所持しているもののみ）。"""
+        return {self.codes[c]: tuple(t) for c, t in enumerate(self._species_totals) if t[0]}
+
+    def by_rarity(self):
+        """{レア度: (数, 合計額)}。"""
+        result = {}
+        for (name, rarity), (count, value) in self.by_species().items():
+            c, v = result.get(rarity, (0, 0))
+            result[rarity] = (c + count, v + value)
+        return result
+
+    # --- [SERIALIZATION] ---
+    def to_dict(self):
+        """保存用の列指向の辞書（墓標は含めない）。"""
+        alive = [i for i in range(len(self.ids)) if self.ids[i]]
+        used = sorted({self.species[i] for i in alive})
+        remap = {old: new for new, old in enumerate(used)}
+        return {
+            "next": self.next_id,
+            "codes": [list(self.codes[c]) for c in used],
+            "id": [self.ids[i] for i in alive],
+            "sp": [remap[self.species[i]] for i in alive],
+            "size": [self.sizes[i] for i in alive],
+            "price": [self.prices[i] for i in alive],
+            "ts": [self.times[i] for i in alive],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        inventory = cls()
+        codes = d.get("codes", [])
+        for item_id, sp, size, price, ts in zip(d["id"], d["sp"], d["size"], d["price"], d["ts"]):
+            name, rarity = codes[sp]
+            inventory.add(name, rarity, size, price, ts, item_id=item_id)
+        inventory.next_id = max(inventory.next_id, d.get("next", 1))
+        return inventory
+
+    @classmethod
+    def from_items(cls, items):
+        """旧形式（獲物ごとの辞書のリスト）から変換します。IDは古い順に1から振ります。"""
+        inventory = cls()
+        for item in items:
+            try:
+                ts = datetime.strptime(item.get("date", ""), "%Y-%m-%d %H:%M").timestamp()
+            except ValueError:
+                ts = 0
+            inventory.add(item.get("name", "不明"), item.get("rarity", "N"),
+                          float(item.get("size", 0)), int(item.get("price", 0)), ts)
+        return inventory
+
+
+class _EmptyInventory(FishInventory):
+    """獲物をまだ持たないレコードが共有で返す空の生け簀（変更不可）。"""
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("空の生け簀は共有のため変更できません（UserRecord.get_inventory() を使用してください）")
+
+    add = remove = remove_where = clear = _read_only
+
+
+EMPTY_INVENTORY = _EmptyInventory()
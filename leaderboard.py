@@ -0,0 +1,43 @@
+from sortedcontainers import SortedList
+from storage import INDEXED_FIELDS
+
+class Leaderboards:
+    """
+    INDEXED_FIELDS ごとのランキング。値が正のユーザーを (-値, ユーザーID) の順序付きリストで保持し、
+    レコードの変更に合わせて差分だけを更新します。上位N件・順位の照会はいずれも O(log n) です。
+    """
+
+    def __init__(self):
+        self._boards = {field: SortedList() for field in INDEXED_FIELDS}
+
+    def rebuild(self, index):
+        """索引（ユーザーID → INDEXED_FIELDS の値）全体からランキングを作り直します。"""
+        for pos, field in enumerate(INDEXED_FIELDS):
+            self._boards[field] = SortedList(
+                (-entry[pos], uid) for uid, entry in index.items() if entry[pos] > 0
+            )
+
+    def update(self, uid, old, new):
+        """ユーザーの索引が old から new に変わったことを反映します（どちらも None 可）。"""
+        for pos, field in enumerate(INDEXED_FIELDS):
+            before = old[pos] if old else 0
+            after = new[pos] if new else 0
+            if before == after:
+                continue
+            board = self._boards[field]
+            if before > 0:
+                board.remove((-before, uid))
+            if after > 0:
+                board.add((-after, uid))
+
+    def top(self, field, limit, offset=0):
+        """[(ユーザーID, 値), ...] を上位から返します。"""
+        return [(int(uid), -neg) for neg, uid in self._boards[field].islice(offset, offset + limit)]
+
+    def rank(self, field, value):
+        """value を持つユーザーの順位（1始まり、同値は同順位）を返します。"""
+        return self._boards[field].bisect_left((-value, "")) + 1
+
+    def count(self, field):
+        """ランキングに載っている（値が正の）ユーザー数。"""
+        return len(self._boards[field])
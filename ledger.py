@@ -1,72 +1,710 @@
-import requests
+import asyncio
+import copy
+import heapq
 import json
-from datetime import datetime
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from storage import INDEXED_FIELDS, is_user_key
+from userstore import TieredUserStore, LocalColdTier, BackendColdTier, index_entry
+from records import UserRecord, UserView
+from studylog import rollup_stamp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+JST = timezone(timedelta(hours=9), 'JST')
+
+# 前回 study_history を集約した時の基準（studylog.rollup_stamp()）を保持するメタデータのキー
+HISTORY_ROLLUP_KEY = "study_history_rollup"
+
+# 新規ユーザーの初期値（joined_at は作成時に付与）
+DEFAULT_USER = UserRecord()
+_DEFAULT_VIEW = UserView(DEFAULT_USER)
+
+# --- [JOURNAL PATCHES] ---
+def _diff(old, new):
+    """
+    辞書 old から new への差分を、ジャーナルに追記するパッチ {キー: 操作} で返します。操作は次のいずれかで、
+    同じパッチを繰り返し適用しても結果は変わりません（スナップショットに反映済みの項目を再生しても安全）。
+        ["=", 値]       値を置き換える
+        ["-"]           キーを削除する
+        ["~", パッチ]   辞書の値にパッチを再帰的に適用する
+        ["[", i, 要素]  リストの i 番目以降を要素で置き換える（末尾への追加は追加分だけになる）
+    """
+    patch = {}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = ["=", value]
+        elif old[key] != value:
+            patch[key] = _diff_value(old[key], value)
+    for key in old:
+        if key not in new:
+            patch[key] = ["-"]
+    return patch
+
+def _diff_value(old, new):
+    if isinstance(old, dict) and isinstance(new, dict):
+        return ["~", _diff(old, new)]
+    if isinstance(old, list) and isinstance(new, list):
+        common = 0
+        for a, b in zip(old, new):
+            if a != b:
+                break
+            common += 1
+        if common:
+            return ["[", common, new[common:]]
+    return ["=", new]
+
+def _apply_patch(target, patch):
+    """_diff() のパッチを辞書 target にその場で適用し、target を返します。"""
+    for key, op in patch.items():
+        if op[0] == "=":
+            target[key] = op[1]
+        elif op[0] == "-":
+            target.pop(key, None)
+        elif op[0] == "~":
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _apply_patch(target[key], op[1])
+        else:
+            if not isinstance(target.get(key), list):
+                target[key] = []
+            target[key][op[1]:] = op[2]
+    return target
+
+def _peak_memory_mb():
+    """プロセスの最大常駐メモリ（MB）。取得できない環境では None を返します。"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class LedgerUnavailable(RuntimeError):
+    """読み込み前・リースの喪失後・引き渡し中など、Ledgerが新しい変更を受け付けない状態で transaction() を開始した"""
 
 class Ledger:
-    def __init__(self, gist_id, github_token):
+    def __init__(self, backend, max_staleness=30, journal_path=None, fsync_interval=0.2,
+                 cold_path="ledger-cold.db", max_hot_records=5000, idle_ttl=1800):
         """
-        Gistを利用したデータ永続化ユニット。
+        データ永続化ユニット。保存先は backend（storage.py）で切り替えます。
+        max_staleness: 変更が保存先へ反映されるまでの最大遅延（秒）
+        journal_path: ローカル追記ジャーナルのパス（Noneで無効）
+        fsync_interval: ジャーナルをディスクへ同期する間隔（秒）
+        cold_path: 退避したユーザーレコードを置くローカルファイル（遅延読み込み可能な保存先では未使用）
+        max_hot_records: メモリ上に展開しておくユーザーレコードの上限
+        idle_ttl: この秒数アクセスのないレコードはコールド層へ退避する
         """
-        self.gist_id = gist_id
-        self.github_token = github_token
-        self.file_name = "ledger.json"
-        self.data = self._load_from_gist()
+        self.backend = backend
+        self.max_staleness = max_staleness
+
+        # データは load() で非同期に読み込む。完了までは ready がセットされない
+        cold = BackendColdTier(backend) if backend.lazy else LocalColdTier(cold_path)
+        self.data = TieredUserStore(cold, max_hot_records=max_hot_records, idle_ttl=idle_ttl)
+        self.loaded = False
+        self.load_error = None
+        self.ready = asyncio.Event()
+        # 他のインスタンスへリースを引き渡した（または失効した）後は読み取り専用になり、fenced がセットされる
+        self.read_only = False
+        self.fenced = asyncio.Event()
+        # リースの引き渡し中は新しい変更を受け付けない（最終保存は行う）
+        self._handing_over = False
+        self._handover_hooks = []
+        # 実行中のトランザクション数（引き渡しの前に完了を待つ）
+        self._active_transactions = 0
+        self._transactions_idle = asyncio.Event()
+        self._transactions_idle.set()
+
+        # 書き込み遅延（write-behind）用の状態
+        self._dirty = False
+        self._dirty_keys = set()
+        self._dirty_all = False
+        self._dirty_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._writer_task = None
+        self._evict_task = None
+        self._lease_task = None
+
+        # transaction() 用のユーザー単位のロック（使用中のものだけを保持する）
+        self._user_locks = weakref.WeakValueDictionary()
+
+        # ジャーナル: スナップショット以降の変更をキー単位でJSON Linesに追記する
+        # （トランザクション・set_meta() による変更は変更前からの差分だけを追記する）
+        self.journal_path = journal_path
+        self.fsync_interval = fsync_interval
+        self._journal = None
+        self._journal_unsynced = False
+        self._sync_task = None
+        # set_meta() の差分の基準: キー → 最後にジャーナルへ書いた値の複製。呼び出し側が保持している
+        # 値（その場で変更され得るもの）とは共有しない。未登録のキーは値全体を追記する
+        self._journaled_meta = {}
 
-    def _load_from_gist(self):
+    async def load(self, retries=3, retry_delay=5):
         """
-        Gistから最新のJSONデータを取得します。
+        保存先からデータを読み込みます（I/Oは別スレッドで実行）。
+        読み込みに失敗した場合、空のデータで上書き保存しないよう Ledger は利用不可のままになります。
+        """
+        started = time.perf_counter()
+        for attempt in range(1, retries + 1):
+            try:
+                await asyncio.to_thread(self._load_into_store)
+                break
+            except Exception as e:
+                self.load_error = e
+                print(f"❌ Load Error ({attempt}/{retries}): {e}")
+                if attempt < retries:
+                    await asyncio.sleep(retry_delay)
+        else:
+            print("🚫 Ledgerを読み込めませんでした。データ保護のため保存を停止します。")
+            self.ready.set()
+            return False
+
+        self.load_error = None
+        if self.backend.needs_full_write:
+            self._mark_all_dirty()
+
+        if self.journal_path:
+            replayed = self._replay_journal()
+            if replayed:
+                print(f"📜 Journal: {replayed} 件の変更を復元しました。")
+                self._mark_all_dirty()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+        self.loaded = True
+        self.ready.set()
+        peak = _peak_memory_mb()
+        memory = f", peak RSS {peak:.0f} MB" if peak is not None else ""
+        print(f"💎 Ledger loaded: {len(self.data)} keys in {time.perf_counter() - started:.2f}s{memory}")
+        return True
+
+    def _load_into_store(self):
+        """
+        保存先のデータをストアへ読み込みます。遅延読み込み可能な保存先では索引のみを読み、
+        それ以外は全件をコールド層へ格納します（いずれもホット層は空で開始）。
+        """
+        if self.backend.lazy:
+            self.data.load_index(self.backend.load_meta(), self.backend.load_index())
+        else:
+            self.data.bulk_load(self.backend.load())
+
+    async def wait_ready(self, timeout=None):
+        """
+        読み込みの完了を待ちます。利用可能になればTrue、失敗またはタイムアウトならFalseを返します。
         """
-        headers = {"Authorization": f"token {self.github_token}"}
-        url = f"https://api.github.com/gists/{self.gist_id}"
-        
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            gist_data = response.json()
-            
-            # 指定したファイル名の内容を取得
-            file_info = gist_data.get("files", {}).get(self.file_name)
-            if file_info:
-                content = file_info.get("content", "{}")
-                return json.loads(content)
-            else:
-                print(f"⚠️ {self.file_name} が見つかりません。新規作成します。")
-                return {}
-        except Exception as e:
-            print(f"❌ Load Error: {e}")
-            return {}
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.writable
+
+    @property
+    def writable(self):
+        """読み込みが完了し、リースを保持していて、引き渡し中でもない（新しい変更を受け付ける）かどうか。"""
+        return self.loaded and not self.read_only and not self._handing_over
+
+    @property
+    def _can_save(self):
+        """保存先へ書き込めるかどうか（引き渡し中の最終保存を含む）。"""
+        return self.loaded and not self.read_only
+
+    def _mark_all_dirty(self):
+        self._dirty = True
+        self._dirty_all = True
+        self._dirty_event.set()
 
     def save(self):
         """
-        現在のデータをGistに保存（上書き）します。
-        """
-        headers = {"Authorization": f"token {self.github_token}"}
-        url = f"https://api.github.com/gists/{self.gist_id}"
-        
-        payload = {
-            "files": {
-                self.file_name: {
-                    "content": json.dumps(self.data, indent=4, ensure_ascii=False)
-                }
-            }
-        }
-        
+        現在のデータを保存先に書き込みます（変化のない部分は送信しません）。
+        同期処理のため、イベントループ上では mark_dirty() / flush() を使用してください。
+        """
+        if not self._can_save:
+            return False
+        self._dirty = False
+        self._dirty_keys.clear()
+        self._dirty_all = False
+        return self.backend.commit(self.backend.prepare(self.data, None))
+
+    # --- [JOURNAL] ---
+    def _rotated_path(self):
+        return self.journal_path + ".1"
+
+    def _stored_dict(self, key):
+        """ジャーナルの差分を適用する元になる、ユーザーレコードの現在の内容（複製）。"""
+        record = self.data.peek(key)
+        return copy.deepcopy(record.to_dict()) if record is not None else {}
+
+    def _replay_journal(self):
+        """
+        前回のスナップショット以降のジャーナルを self.data に適用し、適用件数を返します。
+        圧縮中に終了した場合に備え、退避済みジャーナル(.1)から順に読み込みます。
+        読み込んだスナップショットより古い世代の項目（以前の実行で残ったもの）は適用しません。
+        """
+        snapshot = self.backend.snapshot_generation
+        count = dropped = 0
+        # ユーザーレコードは辞書のまま差分を適用し、最後にまとめて展開する（None は削除）
+        pending = {}
+        for path in (self._rotated_path(), self.journal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で終了した末尾行は無視する
+                        continue
+                    if snapshot is not None and entry.get("g", 0) < snapshot:
+                        dropped += 1
+                        continue
+                    key = entry["k"]
+                    if is_user_key(key):
+                        if "p" in entry:
+                            base = pending[key] if key in pending else self._stored_dict(key)
+                            pending[key] = _apply_patch(base or {}, entry["p"])
+                        else:
+                            pending[key] = entry["v"]
+                    elif "p" in entry:
+                        value = self.data.get(key)
+                        self.data[key] = _apply_patch(value if isinstance(value, dict) else {}, entry["p"])
+                    elif entry.get("v") is None:
+                        self.data.pop(key, None)
+                    else:
+                        self.data[key] = entry["v"]
+                    count += 1
+        for key, value in pending.items():
+            if value is None:
+                self.data.pop(key, None)
+            else:
+                self.data[key] = UserRecord.from_dict(value)
+        if dropped:
+            print(f"📜 Journal: スナップショットより古い世代の変更 {dropped} 件を破棄しました。")
+        return count
+
+    def _append_journal(self, keys, patches):
+        generation = self.backend.generation
+        for key in keys:
+            if key in patches:
+                entry = {"k": key, "p": patches[key]}
+            else:
+                self._journaled_meta.pop(key, None)
+                value = self.data.get(key)
+                if isinstance(value, UserRecord):
+                    value = value.to_dict()
+                entry = {"k": key, "v": value}
+            if generation is not None:
+                entry["g"] = generation
+            self._journal.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        # OSのバッファまで書き出せばプロセスが落ちても失われない。fsyncは _sync_loop がまとめて行う
+        self._journal.flush()
+        self._journal_unsynced = True
+
+    def _rotate_journal(self):
+        """
+        現在のジャーナルを退避し、新しいジャーナルを開きます。
+        前回の圧縮が失敗して退避ファイルが残っている場合はそこへ追記します。
+        """
+        self._journal.close()
+        # 新しいジャーナルの基準は圧縮後のスナップショットになるため、差分の基準を取り直す
+        self._journaled_meta.clear()
+        rotated = self._rotated_path()
+        if os.path.exists(rotated):
+            with open(self.journal_path, encoding="utf-8") as src, open(rotated, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, rotated)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            if self._journal and self._journal_unsynced:
+                self._journal_unsynced = False
+                await asyncio.to_thread(os.fsync, self._journal.fileno())
+
+    # --- [WRITE-BEHIND] ---
+    def mark_dirty(self, *keys, patches=None):
+        """
+        データの変更を記録します。keys には変更したユーザーIDまたはトップレベルのキーを渡します。
+        変更はジャーナルへ即座に追記され、保存先への書き込みはバックグラウンドの書き込みタスクが
+        まとめて行うため、呼び出し側は即座に処理を続行できます。
+        patches（キー → _diff() の差分）を渡したキーは、値全体ではなく差分だけをジャーナルへ追記します。
+        """
+        keys = [str(k) for k in keys]
+        for key in keys:
+            self.data.refresh(key)
+        if self._journal and keys:
+            self._append_journal(keys, patches or {})
+        if keys:
+            self._dirty_keys.update(keys)
+        else:
+            # キー指定のない変更は全体を比較対象にする
+            self._dirty_all = True
+        self._dirty = True
+        self._dirty_event.set()
+
+    def start_writer(self):
+        """
+        バックグラウンド書き込みタスクを起動します（イベントループ上で呼び出すこと）。
+        """
+        if self._writer_task and not self._writer_task.done():
+            return
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        self._evict_task = asyncio.create_task(self._evict_loop())
+        if self.journal_path:
+            self._sync_task = asyncio.create_task(self._sync_loop())
+        if self.backend.leased:
+            self._lease_task = asyncio.create_task(self._lease_loop())
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(60)
+            evicted = self.data.evict()
+            if evicted:
+                print(f"🧊 Ledger: {evicted} 件のレコードをコールド層へ退避しました。")
+
+    async def _lease_loop(self):
+        """
+        リースを定期的に確認します。後継のインスタンスが待機していれば最終保存の後に引き渡し、
+        リースを失っていれば保存を止めて読み取り専用になります。
+        """
+        while not self.read_only:
+            await asyncio.sleep(self.backend.lease_interval)
+            if not self.loaded:
+                continue
+            try:
+                status = await asyncio.to_thread(self.backend.check_lease)
+            except Exception as e:
+                print(f"⚠️ Lease Check Warning: {e}")
+                continue
+            if status == "successor":
+                if await self._hand_over():
+                    self._fence("後継インスタンスへ引き継ぎました")
+            elif status == "lost":
+                self._fence("リースが他のインスタンスに取得されました")
+
+    def on_handover(self, callback):
+        """
+        リースを引き渡す際、最終保存の前に await する関数を登録します（メモリ上に保留中の変更の反映用）。
+        呼び出し時点で writable は False になっているため、writable を確認せずに transaction(force=True) で反映してください。
+        """
+        self._handover_hooks.append(callback)
+
+    async def _hand_over(self, timeout=10):
+        """
+        後継のインスタンスへリースを引き渡します。新しい変更の受付を止め、実行中のトランザクションの完了を待ち、
+        on_handover() で登録された関数で保留中の変更を反映してから最終保存を行い、リースを手放します。
+        失敗した場合は受付を再開して False を返します（後継側はリースの失効を待つ）。
+        """
+        self._handing_over = True
         try:
-            response = requests.patch(url, headers=headers, json=payload)
-            response.raise_for_status()
-            print(f"💾 Data saved to Gist at {datetime.now().strftime('%H:%M:%S')}")
-        except Exception as e:
-            print(f"❌ Save Error: {e}")
+            await asyncio.wait_for(self._transactions_idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("⚠️ 実行中のトランザクションの完了を待たずに引き継ぎます。")
+        for callback in self._handover_hooks:
+            try:
+                await callback()
+            except Exception as e:
+                print(f"⚠️ Handover Hook Warning: {e}")
+        if await self.flush() and await asyncio.to_thread(self.backend.release_lease):
+            return True
+        self._handing_over = False
+        return False
+
+    def _fence(self, reason):
+        self.read_only = True
+        self.fenced.set()
+        print(f"🔒 Ledger is now read-only: {reason}")
+
+    async def _writer_loop(self):
+        while True:
+            await self._dirty_event.wait()
+            # 最初の変更から max_staleness 秒の間に発生した変更を1回の書き込みに集約する
+            await asyncio.sleep(self.max_staleness)
+            await self.flush()
+
+    async def flush(self, full=False):
+        """
+        未保存の変更を即座に保存先へ書き込み（スナップショットを圧縮し）ます。
+        応答前に永続化が必要な処理でのみ await してください。成功時にTrueを返します。
+        full=True の場合は mark_dirty() されていない変更も含め、全体を比較します。
+        """
+        if not self._can_save:
+            # 読み込みに失敗した（または未完了・リース失効の）状態で保存先を上書きしない
+            return False
+        async with self._flush_lock:
+            if not self._dirty and not full:
+                return True
+            keys = None if (full or self._dirty_all) else self._dirty_keys
+            self._dirty = False
+            self._dirty_event.clear()
+            self._dirty_keys = set()
+            self._dirty_all = False
+
+            # ジャーナルの退避とシリアライズはループ上で連続して行い、
+            # 退避したジャーナルの内容がすべてスナップショットに含まれるようにする
+            if self._journal:
+                self._rotate_journal()
+            payload = self.backend.prepare(self.data, keys)
+            ok = await asyncio.to_thread(self.backend.commit, payload)
+            if ok:
+                # 書き込み中に再び変更されたキーは、次回の書き込みまで未保存として扱う
+                self.data.committed(keys, pending=self._dirty_keys)
+                if self._journal and os.path.exists(self._rotated_path()):
+                    os.remove(self._rotated_path())
+            else:
+                # 失敗した場合は次回の書き込みで再試行する（退避したジャーナルは保持する）
+                if keys is None:
+                    self._dirty_all = True
+                else:
+                    self._dirty_keys |= keys
+                self._dirty = True
+                self._dirty_event.set()
+            return ok
+
+    async def close(self):
+        """
+        書き込みタスクを停止し、残りの変更を保存します。
+        """
+        for task in (self._writer_task, self._sync_task, self._evict_task, self._lease_task):
+            if task:
+                task.cancel()
+        self._writer_task = None
+        self._sync_task = None
+        self._evict_task = None
+        self._lease_task = None
+        # 最終保存の後に加えられた変更が失われないよう、先に新しい変更の受付を止める
+        self._handing_over = True
+        if await self.flush() and self.backend.leased:
+            # 次のインスタンスが失効を待たずにリースを取得できるようにする
+            await asyncio.to_thread(self.backend.release_lease)
+            self.read_only = True
+        if self._journal:
+            os.fsync(self._journal.fileno())
 
     def get_user(self, user_id):
         """
         ユーザーデータを取得します。存在しない場合は初期化します。
+        書き込みを伴わない参照には peek_user() を使用してください。
         """
         uid = str(user_id)
         if uid not in self.data:
-            self.data[uid] = {
-                "money": 100,
-                "xp": 0,
-                "joined_at": datetime.now().strftime("%Y-%m-%d")
-            }
+            self.data[uid] = UserRecord(joined_at=datetime.now().strftime("%Y-%m-%d"))
         return self.data[uid]
+
+    def peek_user(self, user_id):
+        """
+        ユーザーデータを読み取り専用で取得します。存在しない場合も記録は作成せず、
+        初期値のビューを返します。
+        """
+        uid = str(user_id)
+        if uid not in self.data:
+            return _DEFAULT_VIEW
+        return UserView(self.data[uid])
+
+    def _user_lock(self, uid):
+        lock = self._user_locks.get(uid)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[uid] = lock
+        return lock
+
+    @asynccontextmanager
+    async def transaction(self, *user_ids, force=False):
+        """
+        複数ユーザーのレコードをまとめて更新するためのコンテキストマネージャ。
+        ユーザー単位のロックをID順に取得するため、同じユーザーを含む処理同士だけが直列化され、
+        無関係なユーザーの処理は並行して進みます。
+        ブロック内で例外が発生した場合はすべての変更を取り消し、正常に抜けた場合は
+        変更されたレコードだけを mark_dirty() します（変更のない新規レコードは作成されません）。
+        money / xp が変わったレコードには、/balance の推移グラフ用にその日（JST）の残高を記録します。
+
+            async with ledger.transaction(sender_id, target_id) as (sender, target):
+                sender.money -= amount
+                target.money += amount
+
+        ユーザーが1人の場合はレコードを、複数の場合は引数の順のタプルを返します。
+        writable でない場合は LedgerUnavailable を送出します（最終保存の後に変更が加えられないようにするため）。
+        force=True は on_handover() で登録した関数からの最終反映用で、引き渡し中でも開始できます。
+        """
+        if not (self._can_save if force else self.writable):
+            raise LedgerUnavailable("Ledger is not accepting changes")
+        uids = [str(u) for u in user_ids]
+        ordered = sorted(set(uids), key=int)
+        locks = [self._user_lock(uid) for uid in ordered]
+        acquired = []
+        self._active_transactions += 1
+        self._transactions_idle.clear()
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired.append(lock)
+
+            records, snapshots, created = {}, {}, set()
+            for uid in ordered:
+                if uid not in self.data:
+                    created.add(uid)
+                records[uid] = self.get_user(uid)
+                snapshots[uid] = records[uid].snapshot()
+
+            try:
+                yield records[uids[0]] if len(uids) == 1 else tuple(records[uid] for uid in uids)
+            except BaseException:
+                for uid in ordered:
+                    if uid in created:
+                        del self.data[uid]
+                    else:
+                        records[uid].restore(snapshots[uid])
+                raise
+
+            changed, patches = [], {}
+            today = datetime.now(JST).strftime("%Y-%m-%d")
+            for uid in ordered:
+                record, before = records[uid], snapshots[uid]
+                if record.money != before["money"] or record.xp != before["xp"]:
+                    record.note_balance(today)
+                after = record.to_dict()
+                if after != before:
+                    # 待機中にコールド層へ退避されていても変更を失わないよう、ストアへ戻してから記録する
+                    self.data[uid] = record
+                    changed.append(uid)
+                    if self._journal and uid not in created:
+                        patches[uid] = _diff(before, after)
+                elif uid in created:
+                    del self.data[uid]
+            if changed:
+                self.mark_dirty(*changed, patches=patches)
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            self._active_transactions -= 1
+            if not self._active_transactions:
+                self._transactions_idle.set()
+
+    def compact_defaults(self):
+        """
+        一度も使われていない初期値のままのユーザー記録を削除し、削除件数を返します。
+        """
+        default_entry = index_entry(DEFAULT_USER)
+        removed = []
+        for uid, entry in list(self.data.index.items()):
+            if entry != default_entry:
+                continue
+            record = self.data.peek(uid)
+            if record is not None and record.is_default(DEFAULT_USER):
+                del self.data[uid]
+                removed.append(uid)
+        if removed:
+            self.mark_dirty(*removed)
+        return len(removed)
+
+    async def compact_study_history(self, today, force=False):
+        """
+        全ユーザーの study_history のうち古い日別の記録を月別・年別へ集約し、集約したユーザー数を返します。
+        集約の基準は月単位でしか変わらないため、前回の集約から基準が変わっていなければ走査しません
+        （force=True の場合は常に走査します）。走査は一定件数ごとにイベントループへ制御を返し、
+        集約の必要なユーザーだけをトランザクションで更新します（合計値は変わりません）。
+        """
+        if not self.writable:
+            return 0
+        stamp = rollup_stamp(today)
+        if not force and self.get_meta(HISTORY_ROLLUP_KEY) == stamp:
+            return 0
+        due = []
+        for scanned, (uid, record) in enumerate(self.users(), 1):
+            if record.history_rollup_due(today):
+                due.append(uid)
+            if scanned % 500 == 0:
+                await asyncio.sleep(0)
+        compacted = 0
+        for uid in due:
+            if not self.writable:
+                break
+            async with self.transaction(uid) as record:
+                if record.compact_history(today):
+                    compacted += 1
+        if self.writable:
+            self.set_meta(HISTORY_ROLLUP_KEY, stamp)
+        return compacted
+
+    # --- [QUERY API] ---
+    def users(self, members=None):
+        """
+        全ユーザー（members を指定した場合はそのユーザーIDのみ）の (ユーザーID, レコード) を返すイテレータ。
+        コールド層のレコードは展開のみで昇格させません。
+        """
+        if members is None:
+            for key, record in self.data.iter_records():
+                yield int(key), record
+            return
+        for key in members:
+            record = self.data.peek(key)
+            if record is not None:
+                yield int(key), record
+
+    def _member_values(self, field, members):
+        pos = INDEXED_FIELDS.index(field)
+        for uid in members:
+            entry = self.data.index.get(uid)
+            if entry and entry[pos] > 0:
+                yield int(uid), entry[pos]
+
+    def top_users(self, field, limit=10, offset=0, members=None):
+        """
+        field（money / xp / total_study_time / best_fish）の上位ユーザーを
+        [(ユーザーID, 値), ...] で返します。値が0のユーザーは含みません。
+        レコードの変更に合わせて差分更新されるランキングから取得します（O(log n)）。
+        members（ユーザーIDの集合）を指定した場合は、そのユーザーの索引だけから求めます。
+        """
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        if members is None:
+            return self.data.boards.top(field, limit, offset)
+        top = heapq.nlargest(offset + limit, self._member_values(field, members), key=lambda v: v[1])
+        return top[offset:]
+
+    def rank_of(self, user_id, field, members=None):
+        """指定ユーザーの順位（1始まり）を返します。記録がない場合は None です。"""
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        entry = self.data.index.get(str(user_id))
+        value = entry[INDEXED_FIELDS.index(field)] if entry else 0
+        if value <= 0 or (members is not None and str(user_id) not in members):
+            return None
+        if members is None:
+            return self.data.boards.rank(field, value)
+        return 1 + sum(1 for _, v in self._member_values(field, members) if v > value)
+
+    def ranked_count(self, field, members=None):
+        """field のランキングに載っているユーザー数を返します。"""
+        if members is None:
+            return self.data.boards.count(field)
+        return sum(1 for _ in self._member_values(field, members))
+
+    def get_meta(self, key, default=None):
+        """ユーザー以外のトップレベルデータ（image_gallery 等）を取得します。"""
+        return self.data.get(key, default)
+
+    def set_meta(self, key, value):
+        """
+        ユーザー以外のトップレベルデータを更新し、保存対象として記録します。
+        辞書の場合、ジャーナルには前回ジャーナルへ書いた値（の複製）からの差分だけを追記するため、
+        取得した値をその場で変更して渡しても変更は失われません。
+        """
+        patches = None
+        journaled = None
+        if self._journal and isinstance(value, dict):
+            journaled = copy.deepcopy(value)
+            base = self._journaled_meta.get(key)
+            if base is not None:
+                patches = {key: _diff(base, journaled)}
+        if value is None:
+            self.data.pop(key, None)
+        else:
+            self.data[key] = value
+        self.mark_dirty(key, patches=patches)
+        if journaled is not None:
+            self._journaled_meta[key] = journaled
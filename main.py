@@ -1,17 +1,36 @@
 import discord 
+from discord import app_commands
 from discord.ext import commands, tasks
 import os
+import asyncio
 from datetime import datetime, timedelta, timezone
-from ledger import Ledger
+from ledger import Ledger, LedgerUnavailable
+from activity import XpAccumulator
+from membership import GuildMembers
+from names import NameResolver
+from charts import ChartRenderer
+from storage import GistBackend, JsonFileBackend, SqliteBackend
 
 # --- [SYSTEM CONFIGURATION] ---
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 GIST_ID = os.getenv("GIST_ID")
 GITHUB_TOKEN = os.getenv("MY_GITHUB_TOKEN")
+# Ledgerの保存先: gist / json / sqlite（json・sqlite はトークン不要のローカル保存）
+LEDGER_BACKEND = os.getenv("LEDGER_BACKEND", "gist")
+LEDGER_PATH = os.getenv("LEDGER_PATH")
+# 変更を即時追記するローカルジャーナル（Gistへのスナップショットは圧縮として低頻度で行う）
+LEDGER_JOURNAL = os.getenv("LEDGER_JOURNAL", "ledger.journal")
 
 JST = timezone(timedelta(hours=9), 'JST')
 
-ledger_instance = None
+def create_ledger_backend():
+    if LEDGER_BACKEND == "sqlite":
+        return SqliteBackend(LEDGER_PATH or "ledger.db")
+    if LEDGER_BACKEND == "json":
+        return JsonFileBackend(LEDGER_PATH or "ledger.json")
+    if GIST_ID and GITHUB_TOKEN:
+        return GistBackend(GIST_ID, GITHUB_TOKEN)
+    return None
 
 # --- [INTENTS & PERMISSIONS] ---
 intents = discord.Intents.default()
@@ -20,24 +39,74 @@ intents.members = True
 intents.presences = True 
 intents.invites = True  # 招待トラッカー用に明示的に有効化
 
+class LedgerGatedTree(app_commands.CommandTree):
+    """
+    Ledgerを使うCogのコマンドを、Ledgerが変更を受け付けられる（writable）状態でのみ処理するコマンドツリー。
+    Cogはクラス属性 uses_ledger = True を宣言すると対象になります。Cogには読み込み前のLedgerが渡されますが、
+    コマンドはここで読み込みの完了を待ってから呼ばれるため、各コマンドで wait_ready() を呼ぶ必要はありません。
+    """
+    async def interaction_check(self, it: discord.Interaction) -> bool:
+        cog = getattr(it.command, "binding", None)
+        ledger = self.client.ledger
+        if not getattr(cog, "uses_ledger", False) or not ledger or await ledger.wait_ready(timeout=2.5):
+            return True
+        if ledger.ready.is_set() and not ledger.loaded:
+            message = "🚫 データを読み込めなかったため、現在この機能は利用できません。管理者にお問い合わせください。"
+        elif ledger.loaded:
+            # 別のインスタンスへの引き渡し中、またはリースを失って読み取り専用になっている
+            message = "🔒 データの保存先を引き継いでいるため、現在は変更を受け付けていません。しばらくしてから再度お試しください。"
+        else:
+            message = "⏳ データを読み込み中です。しばらくしてから再度お試しください。"
+        await it.response.send_message(message, ephemeral=True)
+        return False
+
+    async def on_error(self, it: discord.Interaction, error: app_commands.AppCommandError):
+        # 確認の通過後にLedgerが引き渡し・停止に入った場合は transaction() が LedgerUnavailable を送出する
+        if isinstance(getattr(error, "original", error), LedgerUnavailable):
+            message = "⏳ データを保存中のため、変更を受け付けられませんでした。しばらくしてから再度お試しください。"
+            if it.response.is_done():
+                await it.followup.send(message, ephemeral=True)
+            else:
+                await it.response.send_message(message, ephemeral=True)
+            return
+        await super().on_error(it, error)
+
 class Rb_m25_Bot(commands.Bot):
     def __init__(self):
         super().__init__(
             command_prefix="!",
             intents=intents,
-            help_command=None
+            help_command=None,
+            tree_cls=LedgerGatedTree
         )
         self.start_time = datetime.now(JST)
         
-        if GIST_ID and GITHUB_TOKEN:
-            self.ledger = Ledger(GIST_ID, GITHUB_TOKEN)
-            print("💎 Ledger System: Connected")
+        # Ledgerの読み込みは login() でゲートウェイ接続と並行して行う。
+        # Cogには読み込み前のハンドルを渡す（コマンドは LedgerGatedTree が読み込みの完了を待ってから処理する）
+        backend = create_ledger_backend()
+        if backend:
+            self.ledger = Ledger(backend, max_staleness=600, journal_path=LEDGER_JOURNAL)
+            print(f"💎 Ledger System: Connected ({backend.name})")
         else:
             self.ledger = None
             print("⚠️ Ledger System: Disabled (Missing Env Vars)")
-        
-        global ledger_instance
-        ledger_instance = self.ledger
+        self.ledger_task = None
+        # 発言によるXPはメモリ上で集計し、1分ごとにLedgerへまとめて反映する
+        self.xp = XpAccumulator(self.ledger) if self.ledger else None
+        if self.ledger:
+            # リースを引き渡す前に、保留中のXPを最終保存へ含める
+            self.ledger.on_handover(lambda: self.xp.merge(force=True))
+        # ギルド単位のランキング用に、ギルドごとのメンバーを保持する
+        self.guild_members = GuildMembers()
+        # ランキング表示用の表示名キャッシュ（最後の既知の名前はLedgerに保存する）
+        self.names = NameResolver(self)
+        # グラフ描画はプロセスプールで行う（初回の描画時に起動）
+        self.charts = ChartRenderer()
+
+    async def login(self, token):
+        if self.ledger:
+            self.ledger_task = asyncio.create_task(self.ledger.load())
+        await super().login(token)
 
     async def setup_hook(self):
         print("\n--- [SYSTEM BOOT SEQUENCE] ---")
@@ -83,20 +152,58 @@ class Rb_m25_Bot(commands.Bot):
         except Exception as e:
             print(f"⚠️ Sync failed: {e}")
 
+        if self.ledger:
+            self.ledger.start_writer()
+            self.xp.start()
+            asyncio.create_task(self.close_on_fence())
+
         self.update_status.start()
         self.auto_save.start()
+        if self.ledger:
+            self.compact_history.start()
         print("--- [SYSTEM READY] ---\n")
 
-    @tasks.loop(minutes=10)
+    @tasks.loop(minutes=30)
     async def auto_save(self):
         if self.ledger:
             try:
-                self.ledger.save()
+                # mark_dirty() されていない変更も拾うため全シャードを比較する（変化がなければ送信しない）
+                await self.ledger.flush(full=True)
                 now_str = datetime.now(JST).strftime('%H:%M')
-                print(f"💾 [AUTO-SAVE] {now_str} Data synchronized to Gist.")
+                print(f"💾 [AUTO-SAVE] {now_str} Data synchronized to {self.ledger.backend.name}.")
             except Exception as e:
                 print(f"❌ [AUTO-SAVE ERROR] {e}")
 
+    @tasks.loop(hours=24)
+    async def compact_history(self):
+        # 学習履歴の古い日別の記録を月別・年別へ集約し、保存データの肥大化を防ぐ
+        # （集約の基準が前回から変わっていない日は全体を走査しないため、起動直後の実行も軽い）
+        try:
+            compacted = await self.ledger.compact_study_history(datetime.now(JST).date())
+            if compacted:
+                print(f"🗜️ [HISTORY ROLL-UP] {compacted} 人分の学習履歴を集約しました。")
+        except Exception as e:
+            print(f"❌ [HISTORY ROLL-UP ERROR] {e}")
+
+    @compact_history.before_loop
+    async def before_compact_history(self):
+        await self.wait_until_ready()
+        await self.ledger.wait_ready()
+
+    async def close_on_fence(self):
+        # 新しいインスタンスへLedgerを引き渡した後は、同じトークンで応答が重複しないよう終了する
+        await self.ledger.fenced.wait()
+        print("👋 Ledgerを引き継いだため、このインスタンスを終了します。")
+        await self.close()
+
+    async def close(self):
+        # 終了前に未保存の変更を保存先へ書き出す
+        if self.ledger:
+            await self.xp.close()
+            await self.ledger.close()
+        self.charts.close()
+        await super().close()
+
     @auto_save.before_loop
     async def before_auto_save(self):
         await self.wait_until_ready()
@@ -140,21 +247,42 @@ async def on_ready():
     print(f"✅ Logged in as: {bot.user.name} (ID: {bot.user.id})")
     # インテントの状態を起動ログに表示
     print(f"💎 Intents: Presence={'✅' if intents.presences else '❌'}, Members={'✅' if intents.members else '❌'}, Invites={'✅' if intents.invites else '❌'}")
+    for guild in bot.guilds:
+        await load_guild_members(guild)
 
-@bot.event
-async def on_message(message):
-    if message.author.bot:
-        return
-    
-    if bot.ledger:
+async def load_guild_members(guild):
+    # メンバー一覧が未取得（チャンク前）のギルドは取得してから索引を作る
+    if not guild.chunked:
         try:
-            u = bot.ledger.get_user(message.author.id)
-            u["xp"] = u.get("xp", 0) + 1
-            # 内部データ更新のみ。セーブはauto_saveタスクに任せるのが安全
+            await guild.chunk()
         except Exception as e:
-            print(f"❌ Experience System Error: {e}")
+            print(f"⚠️ Member Chunk Warning ({guild.name}): {e}")
+    bot.guild_members.load_guild(guild)
+
+@bot.event
+async def on_guild_join(guild):
+    await load_guild_members(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    bot.guild_members.drop_guild(guild.id)
+
+@bot.event
+async def on_member_join(member):
+    if not member.bot:
+        bot.guild_members.add(member.guild.id, member.id)
+
+@bot.event
+async def on_member_remove(member):
+    bot.guild_members.remove(member.guild.id, member.id)
 
-    await bot.process_commands(message)
+@bot.event
+async def on_message(message):
+    # プレフィックスコマンドは使用しないため process_commands() は呼び出さない
+    if message.author.bot or not bot.xp:
+        return
+    # 保留テーブルへの加算のみ。Ledgerへの反映は XpAccumulator がまとめて行う
+    bot.xp.record(message.author.id)
 
 if __name__ == "__main__":
     if not TOKEN:
@@ -0,0 +1,45 @@
+class GuildMembers:
+    """
+    ギルドID → 所属メンバーのユーザーID（Ledgerのキーと同じ文字列）の集合。
+    ギルド単位のランキングを、全ユーザーを走査せずにメンバーだけから求めるために使います。
+    メンバーの参加・脱退イベントと、ギルドのメンバー一覧の取得（チャンク）で更新されます。
+    """
+
+    def __init__(self):
+        self._members = {}
+
+    def load_guild(self, guild):
+        """ギルドのメンバー一覧（キャッシュ済みのもの）から集合を作り直します。"""
+        self._members[guild.id] = {str(m.id) for m in guild.members if not m.bot}
+
+    def drop_guild(self, guild_id):
+        self._members.pop(guild_id, None)
+
+    def add(self, guild_id, user_id):
+        members = self._members.get(guild_id)
+        if members is not None:
+            members.add(str(user_id))
+
+    def remove(self, guild_id, user_id):
+        members = self._members.get(guild_id)
+        if members is not None:
+            members.discard(str(user_id))
+
+    def get(self, guild_id):
+        """メンバーの集合を返します。まだ読み込まれていないギルドでは None です。"""
+        return self._members.get(guild_id)
+
+    def for_guild(self, guild):
+        """メンバーの集合を返します。未読み込みのギルドはキャッシュ済みのメンバーから作成します。"""
+        if guild.id not in self._members:
+            self.load_guild(guild)
+        return self._members[guild.id]
+
+    def scope(self, guild, scope):
+        """
+        コマンドの集計範囲（"server" / "global"）に対応するメンバーの集合を返します。
+        全体、またはギルド外（DM）では None（＝全ユーザー）です。
+        """
+        if scope == "global" or guild is None:
+            return None
+        return self.for_guild(guild)
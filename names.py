@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+class NameResolver:
+    """
+    ランキング表示用のユーザーID → 表示名の解決サービス。
+    1. サーバーのメンバーキャッシュ（ニックネーム）
+    2. LRU+TTLキャッシュ
+    3. Botのユーザーキャッシュ
+    4. Ledgerに保存された最後の既知の名前（persist_ttl 以内のもの）
+    5. 上記で解決できなかったものだけを fetch_user でまとめて並行取得（同時実行数は concurrency まで）
+    の順に解決するため、ランキング1回あたりのREST呼び出しは多くても1バッチ、通常は0回です。
+    """
+    META_KEY = "display_names"
+
+    def __init__(self, bot, max_entries=2048, ttl=3600, persist_ttl=7 * 86400, concurrency=5):
+        self.bot = bot
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_ttl = persist_ttl
+        self._cache = OrderedDict()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    # --- [LRU+TTL CACHE] ---
+    def _cached(self, uid):
+        entry = self._cache.get(uid)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < time.monotonic():
+            del self._cache[uid]
+            return None
+        self._cache.move_to_end(uid)
+        return name
+
+    def _remember(self, uid, name):
+        self._cache[uid] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(uid)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    # --- [RESOLUTION] ---
+    async def _fetch(self, uid):
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(uid)
+            except Exception:
+                return None
+        return user.display_name
+
+    async def resolve(self, guild, user_ids):
+        """user_ids の表示名を {ユーザーID: 表示名} で返します。解決できないものは User_xxxx になります。"""
+        ledger = self.bot.ledger
+        persisted = ledger.get_meta(self.META_KEY, {}) if ledger and ledger.writable else {}
+        now = time.time()
+
+        names = {}
+        learned = {}
+        misses = []
+        for uid in user_ids:
+            member = guild.get_member(uid) if guild else None
+            if member:
+                names[uid] = member.display_name
+                continue
+            name = self._cached(uid)
+            if name is None:
+                user = self.bot.get_user(uid)
+                if user:
+                    name = user.display_name
+                    learned[uid] = name
+                else:
+                    saved = persisted.get(str(uid))
+                    if saved and now - saved[1] < self.persist_ttl:
+                        name = saved[0]
+                        self._remember(uid, name)
+            if name is None:
+                misses.append(uid)
+            else:
+                names[uid] = name
+
+        if misses:
+            for uid, name in zip(misses, await asyncio.gather(*(self._fetch(uid) for uid in misses))):
+                if name:
+                    learned[uid] = name
+                    names[uid] = name
+                else:
+                    # 取得できなかったユーザーも再取得を繰り返さないようキャッシュする
+                    saved = persisted.get(str(uid))
+                    names[uid] = saved[0] if saved else f"User_{str(uid)[:4]}"
+                    self._remember(uid, names[uid])
+
+        for uid, name in learned.items():
+            self._remember(uid, name)
+        self._persist(persisted, learned, now)
+        return names
+
+    def _persist(self, persisted, learned, now):
+        """新しく判明した（または変わった・古くなった）名前だけをLedgerへ書き戻します。"""
+        ledger = self.bot.ledger
+        if not learned or not ledger or not ledger.writable:
+            return
+        updated = None
+        for uid, name in learned.items():
+            saved = persisted.get(str(uid))
+            if saved and saved[0] == name and now - saved[1] < self.persist_ttl / 2:
+                continue
+            if updated is None:
+                updated = dict(persisted)
+            updated[str(uid)] = [name, int(now)]
+        if updated is not None:
+            ledger.set_meta(self.META_KEY, updated)
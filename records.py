@@ -0,0 +1,291 @@
+# ユーザーレコードのスキーマ定義とバージョン移行
+import bisect
+import copy
+import heapq
+from datetime import date
+from types import MappingProxyType
+from inventory import FishInventory, EMPTY_INVENTORY
+from studylog import StudyRing, rollup_due, rollup_history
+
+SCHEMA_VERSION = 4
+
+# 未作成の任意項目の代わりに返す共有の空の値（変更不可）
+_EMPTY_MAP = MappingProxyType({})
+_EMPTY_RING = StudyRing()
+
+
+def _migrate_v0(d):
+    """
+    v0（バージョン情報のない旧形式の辞書）→ v1。
+    各Cogが .get(key, 0) で補っていた欠損値・型の揺れをここで正規化します。
+    """
+    d["money"] = int(d.get("money", 0))
+    d["xp"] = int(d.get("xp", 0))
+    d["total_study_time"] = int(d.get("total_study_time", 0))
+    d["is_studying"] = bool(d.get("is_studying", False))
+    d["study_history"] = {k: int(v) for k, v in d.get("study_history", {}).items()}
+    d["fishing_inventory"] = list(d.get("fishing_inventory", []))
+    d["v"] = 1
+    return d
+
+def _migrate_v1(d):
+    """
+    v1 → v2。生け簀を獲物ごとの辞書のリストから、種コード表＋並列配列の形式に変換し、
+    各獲物に安定したIDを振ります。
+    """
+    if "fishing_inventory" in d:
+        d["fishing_inventory"] = FishInventory.from_items(d["fishing_inventory"]).to_dict()
+    d["v"] = 2
+    return d
+
+def _migrate_v2(d):
+    """
+    v2 → v3。売却しても消えない自己ベスト（fishing_bests）を、現在の生け簀の上位から作ります。
+    """
+    if "fishing_inventory" in d:
+        inventory = FishInventory.from_dict(d["fishing_inventory"])
+        bests = heapq.nlargest(UserRecord.PERSONAL_BESTS, inventory, key=lambda item: item.size)
+        if bests:
+            d["fishing_bests"] = [[item.size, item.name, item.rarity, item.ts] for item in bests]
+    d["v"] = 3
+    return d
+
+def _migrate_v3(d):
+    """
+    v3 → v4。直近の学習時間を日付の通し番号で引けるリングバッファ（study_recent）を study_history から作ります。
+    """
+    ring = StudyRing()
+    for day_str, minutes in sorted(d.get("study_history", {}).items()):
+        try:
+            ring.add(date.fromisoformat(day_str).toordinal(), int(minutes))
+        except ValueError:
+            continue
+    if ring:
+        d["study_recent"] = ring.to_dict()
+    d["v"] = 4
+    return d
+
+# 読み込んだバージョン → 次のバージョンへの移行関数
+MIGRATIONS = {
+    0: _migrate_v0,
+    1: _migrate_v1,
+    2: _migrate_v2,
+    3: _migrate_v3,
+}
+
+
+def migrate(d):
+    """保存されていた辞書を現在のスキーマまで順に移行します。"""
+    version = d.get("v", 0)
+    while version < SCHEMA_VERSION:
+        d = MIGRATIONS[version](d)
+        version = d["v"]
+    return d
+
+
+def stored_value(d, field):
+    """
+    保存されていた辞書（旧バージョンを含む）から、移行を行わずに索引用の値を取り出します。
+    値は移行後の UserRecord の同名の属性と一致します（best_fish は自己ベストの最大サイズ）。
+    """
+    if field != "best_fish":
+        return int(d.get(field, 0))
+    if d.get("v", 0) >= 3:
+        bests = d.get("fishing_bests")
+        return bests[0][0] if bests else 0
+    # v3 より前は自己ベストを生け簀の最大サイズから作る（_migrate_v2）
+    inventory = d.get("fishing_inventory")
+    if not inventory:
+        return 0
+    if isinstance(inventory, dict):
+        return max(inventory["size"], default=0)
+    return max((float(item.get("size", 0)) for item in inventory), default=0)
+
+
+class UserRecord:
+    """
+    1ユーザー分のデータ。__slots__ により辞書を持たず、項目はすべて明示されます。
+    スキーマにない項目は extra に保持し、保存時にそのまま書き戻します。
+    履歴・生け簀などの入れ物は最初に書き込む時まで作らず（None）、参照時は共有の空の値を返します。
+    """
+    __slots__ = (
+        "money", "xp", "joined_at",
+        "is_studying", "study_start_time", "total_study_time", "_study_history", "_study_recent",
+        "_fishing_inventory", "_fishing_bests", "_balance_history", "extra",
+    )
+
+    # fishing_bests に保持する自己ベストの件数
+    PERSONAL_BESTS = 10
+
+    # balance_history に保持する日数
+    BALANCE_HISTORY_DAYS = 30
+
+    def __init__(self, money=100, xp=0, joined_at=None):
+        self.money = money
+        self.xp = xp
+        self.joined_at = joined_at
+        self.is_studying = False
+        self.study_start_time = None
+        self.total_study_time = 0
+        # 日付（または集約後の月・年） → 分
+        self._study_history = None
+        # 直近の日別学習時間（分）。期間別の集計を日付の解析なしで行うためのもの
+        self._study_recent = None
+        self._fishing_inventory = None
+        # 自己ベスト（サイズの大きい順）: [[サイズ, 名前, レア度, 釣った時刻], ...]
+        self._fishing_bests = None
+        # 日付 → [その日の最終的な money, xp]
+        self._balance_history = None
+        self.extra = None
+
+    @property
+    def study_history(self):
+        return self._study_history or _EMPTY_MAP
+
+    @property
+    def study_recent(self):
+        return self._study_recent or _EMPTY_RING
+
+    @property
+    def fishing_inventory(self):
+        """生け簀（読み取り用）。獲物を追加・売却する場合は get_inventory() を使用してください。"""
+        return self._fishing_inventory or EMPTY_INVENTORY
+
+    @property
+    def fishing_bests(self):
+        return self._fishing_bests or ()
+
+    @property
+    def balance_history(self):
+        return self._balance_history or _EMPTY_MAP
+
+    def get_inventory(self):
+        """書き込み用の生け簀を返します。まだ無い場合は作成します。"""
+        if self._fishing_inventory is None:
+            self._fishing_inventory = FishInventory()
+        return self._fishing_inventory
+
+    @property
+    def best_fish(self):
+        """これまでに釣った獲物の最大サイズ（ランキング索引用）。売却しても下がりません。"""
+        return self.fishing_bests[0][0] if self.fishing_bests else 0
+
+    @classmethod
+    def from_dict(cls, d):
+        d = migrate(dict(d))
+        d.pop("v")
+        record = cls(d.pop("money", 0), d.pop("xp", 0), d.pop("joined_at", None))
+        record.is_studying = d.pop("is_studying", False)
+        record.study_start_time = d.pop("study_start_time", None)
+        record.total_study_time = d.pop("total_study_time", 0)
+        record._study_history = d.pop("study_history", None) or None
+        if "study_recent" in d:
+            record._study_recent = StudyRing.from_dict(d.pop("study_recent"))
+        if "fishing_inventory" in d:
+            record._fishing_inventory = FishInventory.from_dict(d.pop("fishing_inventory"))
+        record._fishing_bests = d.pop("fishing_bests", None) or None
+        record._balance_history = d.pop("balance_history", None) or None
+        record.extra = d or None
+        return record
+
+    def to_dict(self):
+        """保存用の辞書に変換します。初期値のままの任意項目は省略します。"""
+        d = {"v": SCHEMA_VERSION, "money": self.money, "xp": self.xp}
+        if self.joined_at:
+            d["joined_at"] = self.joined_at
+        if self.is_studying:
+            d["is_studying"] = True
+        if self.study_start_time:
+            d["study_start_time"] = self.study_start_time
+        if self.total_study_time:
+            d["total_study_time"] = self.total_study_time
+        if self._study_history:
+            d["study_history"] = self._study_history
+        if self._study_recent:
+            d["study_recent"] = self._study_recent.to_dict()
+        inventory = self._fishing_inventory
+        if inventory is not None and (inventory or inventory.next_id > 1):
+            d["fishing_inventory"] = inventory.to_dict()
+        if self._fishing_bests:
+            d["fishing_bests"] = self._fishing_bests
+        if self._balance_history:
+            d["balance_history"] = self._balance_history
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def add_study(self, day, minutes):
+        """day（date）の学習時間として minutes 分を、日別の履歴・直近のリングバッファ・累計に記録します。"""
+        key = day.isoformat()
+        if self._study_history is None:
+            self._study_history = {}
+        if self._study_recent is None:
+            self._study_recent = StudyRing()
+        self._study_history[key] = self._study_history.get(key, 0) + minutes
+        self._study_recent.add(day.toordinal(), minutes)
+        self.total_study_time += minutes
+
+    def history_rollup_due(self, today):
+        """study_history に月別・年別へ集約すべき古い記録があるかどうか。"""
+        return bool(self._study_history) and rollup_due(self._study_history, today)
+
+    def compact_history(self, today):
+        """study_history の古い記録を月別・年別へ集約し、集約した項目数を返します。"""
+        return rollup_history(self._study_history, today) if self._study_history else 0
+
+    def note_catch(self, name, rarity, size, ts):
+        """
+        釣った獲物を自己ベストに照らし合わせます。上位 PERSONAL_BESTS 件に入れば
+        その順位（1始まり）を、入らなければ None を返します。
+        """
+        if self._fishing_bests is None:
+            self._fishing_bests = []
+        bests = self._fishing_bests
+        pos = bisect.bisect_right(bests, -size, key=lambda entry: -entry[0])
+        if pos >= self.PERSONAL_BESTS:
+            return None
+        bests.insert(pos, [size, name, rarity, int(ts)])
+        del bests[self.PERSONAL_BESTS:]
+        return pos + 1
+
+    def note_balance(self, day):
+        """day（YYYY-MM-DD）時点の money / xp を記録します。古い日付は BALANCE_HISTORY_DAYS 日分まで残します。"""
+        if self._balance_history is None:
+            self._balance_history = {}
+        history = self._balance_history
+        if day not in history and len(history) >= self.BALANCE_HISTORY_DAYS:
+            for old in sorted(history)[:len(history) - self.BALANCE_HISTORY_DAYS + 1]:
+                del history[old]
+        history[day] = [self.money, self.xp]
+
+    def snapshot(self):
+        """現在の内容の複製を保存用の辞書で返します（トランザクションのロールバック用）。"""
+        return copy.deepcopy(self.to_dict())
+
+    def restore(self, snapshot):
+        """snapshot() で取得した内容に、このレコード自体を書き戻します。"""
+        source = UserRecord.from_dict(snapshot)
+        for name in self.__slots__:
+            setattr(self, name, getattr(source, name))
+
+    def is_default(self, default):
+        """default（初期値のレコード）から一度も変更されていないかどうかを判定します。"""
+        d = self.to_dict()
+        d.pop("joined_at", None)
+        expected = default.to_dict()
+        expected.pop("joined_at", None)
+        return d == expected
+
+
+class UserView:
+    """UserRecord の読み取り専用ビュー。書き込みを伴わない参照に使います。"""
+    __slots__ = ("_record",)
+
+    def __init__(self, record):
+        object.__setattr__(self, "_record", record)
+
+    def __getattr__(self, name):
+        return getattr(self._record, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserView is read-only")
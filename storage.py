@@ -0,0 +1,624 @@
+import requests
+import codecs
+import json
+import os
+import zlib
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# ランキング用に索引付けされるユーザー項目
+INDEXED_FIELDS = ("money", "xp", "total_study_time", "best_fish")
+
+def is_user_key(key):
+    """ユーザーレコードのキー（数字のみのID）かどうかを判定します。"""
+    return key.isdigit()
+
+def field_value(record, field):
+    """UserRecord から索引用の値を取り出します。best_fish は売却しても消えない歴代の自己ベストのサイズです。"""
+    return getattr(record, field)
+
+
+# 数値リテラルに現れる文字（iter_json_members() で数値がチャンクの境界で切れていないかの判定用）
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+def dump_object(items):
+    """
+    (キー, JSON文字列) の組から、1行1レコードのJSONオブジェクトを組み立てます。
+    コールド層のレコードは展開・再シリアライズせずにそのまま連結できます。
+    """
+    body = ",\n".join(f"{json.dumps(key, ensure_ascii=False)}: {raw}" for key, raw in items)
+    return "{\n" + body + "\n}"
+
+
+def iter_json_members(chunks):
+    """
+    文字列チャンクのイテレータからトップレベルのJSONオブジェクトを逐次解析し、
+    (キー, 値) を順に返します。保持する文字列は未解析の部分（最大でおよそ1レコード分）だけです。
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                raise ValueError("JSONが途中で終わっています")
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"JSONの解析に失敗しました: '{char}' が必要な位置に '{buf[pos]}' があります")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # 値の直後には必ず区切り文字が続くため、バッファの末尾で終わった値は続きを読んで確定させる。
+                # 数値は途中で切れても（"1e" → 1、"49270." → 49270）解析できてしまうため、数値の文字が
+                # バッファの末尾まで続く場合も続きを読む
+                tail = end
+                if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+                    while tail < len(buf) and buf[tail] in _NUMBER_CHARS:
+                        tail += 1
+                if tail < len(buf) or eof:
+                    pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            more()
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = value()
+        expect(":")
+        yield key, value()
+        if peek() == "}":
+            return
+        expect(",")
+
+
+class StorageBackend:
+    """
+    Ledgerの保存先の共通インターフェース。
+    prepare() はイベントループ上で呼ばれ、書き込み内容を確定します（データの一貫性のため）。
+    commit() は別スレッドで呼ばれ、実際のI/Oを行います。
+    prepare() に渡される data は userstore.TieredUserStore です。
+    """
+    name = "base"
+    # ジャーナルの世代。generation はこれから追記する項目に記録する世代、snapshot_generation は
+    # 読み込んだスナップショットの世代で、それより古い世代の項目は再生しません（None は世代を区別しない）
+    generation = None
+    snapshot_generation = None
+    # True の場合、load_meta() / load_index() / load_record_raw() でレコードを遅延読み込みできる
+    lazy = False
+    # True の場合、複数インスタンス間の書き込み権（リース）を check_lease() / release_lease() で管理する
+    leased = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def prepare(self, data, keys):
+        """keys は変更されたトップレベルキーの集合。None の場合は全体を比較対象とします。"""
+        raise NotImplementedError
+
+    def commit(self, payload):
+        raise NotImplementedError
+
+    def check_lease(self):
+        """
+        リースの状態を返します: "held"（保持中）/ "successor"（後継が引き継ぎを待機中）/ "lost"（失効）。
+        """
+        return "held"
+
+    def release_lease(self):
+        return True
+
+
+class GistBackend(StorageBackend):
+    """
+    GitHub Gistへの保存。ユーザーはハッシュで ledger-00.json ～ に振り分け、
+    それ以外のトップレベルキーは個別のファイルに保存します。
+    内容が変化したファイルだけをPATCHします。
+
+    同じGistを複数のインスタンスが同時に使う場合に備え、_lease.json に書き込み権（リース）を記録します。
+    新しいインスタンスは保持中のインスタンスに引き継ぎを要求し、最終保存が終わってから読み込みます。
+    保存前にはETagによる条件付きリクエストで他のインスタンスからの書き込みを検出します。
+    スナップショットと同時に _snapshot.json へ書き込んだインスタンスのリースの epoch を記録し、
+    ジャーナルの世代として使います。
+    """
+    name = "gist"
+    leased = True
+
+    def __init__(self, gist_id, github_token, shard_count=16, instance_id=None,
+                 lease_ttl=300, lease_interval=30):
+        """
+        lease_ttl: この秒数ハートビートが更新されないリースは失効したものとみなす
+        lease_interval: リースの確認・引き継ぎ待ちの間隔（秒）
+        """
+        self.gist_id = gist_id
+        self.github_token = github_token
+        self.legacy_file_name = "ledger.json"
+        self.shard_prefix = "ledger"
+        self.shard_count = shard_count
+
+        # ファイルごとの内容ハッシュ（変化のないシャードはアップロードしない）
+        self._file_hashes = {}
+        self._legacy_pending = False
+
+        # 条件付きリクエスト用の状態（最後に確認したGistのETag・更新日時）
+        self._etag = None
+        self._updated_at = None
+
+        self.lease_file_name = "_lease.json"
+        self.instance_id = instance_id or uuid.uuid4().hex[:12]
+        self.lease_ttl = lease_ttl
+        self.lease_interval = lease_interval
+        self._lease = None
+
+        self.snapshot_file_name = "_snapshot.json"
+        self.snapshot_generation = None
+
+    # --- [SHARD LAYOUT] ---
+    def _shard_name(self, key):
+        if is_user_key(key):
+            index = zlib.crc32(key.encode()) % self.shard_count
+            return f"{self.shard_prefix}-{index:02x}.json"
+        return f"{key}.json"
+
+    def _shard_key(self, file_name):
+        """ファイル名がシャード以外（個別キー）の場合はそのキー名を返します。"""
+        if file_name.startswith(self.shard_prefix + "-"):
+            return None
+        return file_name[:-len(".json")]
+
+    def _headers(self):
+        return {"Authorization": f"token {self.github_token}"}
+
+    @property
+    def generation(self):
+        """保持中のリースの epoch（このインスタンスが書き込むスナップショットの世代）。"""
+        return self._lease["epoch"] if self._lease else None
+
+    def _read_snapshot_generation(self, files):
+        """_snapshot.json に記録された世代。記録のない（世代管理の導入前の）スナップショットは 0 です。"""
+        info = files.get(self.snapshot_file_name)
+        try:
+            return json.loads(info.get("content") or "{}").get("epoch", 0) if info else 0
+        except ValueError:
+            return 0
+
+    def _api_url(self):
+        return f"https://api.github.com/gists/{self.gist_id}"
+
+    def _fetch_gist(self, conditional=False):
+        """
+        Gistのメタデータを取得します。conditional=True の場合は前回のETagで条件付きリクエストを行い、
+        変化がなければ（304）None を返します。
+        """
+        headers = self._headers()
+        if conditional and self._etag:
+            headers["If-None-Match"] = self._etag
+        response = requests.get(self._api_url(), headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        gist = response.json()
+        self._remember_version(response, gist)
+        return gist
+
+    def _remember_version(self, response, gist):
+        self._etag = response.headers.get("ETag")
+        self._updated_at = gist.get("updated_at")
+
+    def _stream_file(self, name, url):
+        """
+        切り詰められたファイルを raw_url からチャンク単位で受信し、逐次解析します（ブロッキング）。
+        全文・デコード済み文字列・辞書を同時に保持しないよう、シャードは1レコードずつ取り出します。
+        (解析済みの値, 内容のハッシュ, 受信バイト数) を返します。
+        """
+        sha = hashlib.sha1()
+        size = 0
+        decoder = codecs.getincrementaldecoder("utf-8")()
+
+        def chunks(response):
+            nonlocal size
+            for raw in response.iter_content(chunk_size=64 * 1024):
+                sha.update(raw)
+                size += len(raw)
+                yield decoder.decode(raw)
+            yield decoder.decode(b"", final=True)
+
+        with requests.get(url, headers=self._headers(), stream=True) as response:
+            response.raise_for_status()
+            if name == self.legacy_file_name or self._shard_key(name) is None:
+                value = dict(iter_json_members(chunks(response)))
+            else:
+                value = json.loads("".join(chunks(response)))
+        return value, sha.hexdigest(), size
+
+    @staticmethod
+    def _digest(content):
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def load(self):
+        """
+        リースを取得してから、Gistから最新のJSONデータを取得します。
+        メタデータに含まれない（切り詰められた）シャードは raw_url から並列に取得します。
+        """
+        self._acquire_lease()
+        files = self._fetch_gist().get("files", {})
+        self.snapshot_generation = self._read_snapshot_generation(files)
+
+        # ファイル名 → (解析済みの値, 内容のハッシュ)
+        parsed = {}
+        truncated = {}
+        for name, info in files.items():
+            # "_" で始まるファイル（リース等）はLedgerのデータではない
+            if not name.endswith(".json") or name.startswith("_"):
+                continue
+            if info.get("truncated"):
+                truncated[name] = info["raw_url"]
+            else:
+                content = info.pop("content", None) or "{}"
+                parsed[name] = (json.loads(content), self._digest(content))
+
+        if truncated:
+            streamed = 0
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = pool.map(self._stream_file, truncated, truncated.values())
+                for name, (value, digest, size) in zip(truncated, results):
+                    parsed[name] = (value, digest)
+                    streamed += size
+            print(f"📥 Gist: 切り詰められた {len(truncated)} ファイルを raw_url から取得しました ({streamed / 1e6:.1f} MB)")
+
+        data = {}
+        shard_files = [n for n in parsed if n != self.legacy_file_name]
+        if shard_files:
+            for name in shard_files:
+                value, self._file_hashes[name] = parsed.pop(name)
+                key = self._shard_key(name)
+                if key is None:
+                    data.update(value)
+                else:
+                    data[key] = value
+        elif self.legacy_file_name in parsed:
+            # 旧形式（単一の ledger.json）からの移行。次回保存時にシャードへ分割する
+            print(f"🔀 {self.legacy_file_name} をシャード形式へ移行します。")
+            data = parsed[self.legacy_file_name][0]
+        else:
+            print("⚠️ Ledgerデータが見つかりません。新規作成します。")
+        self._legacy_pending = self.legacy_file_name in parsed
+        return data
+
+    @property
+    def needs_full_write(self):
+        return self._legacy_pending
+
+    def prepare(self, data, keys):
+        """
+        変更されたキーを含むファイルをシリアライズし、前回保存時から変化したものだけを返します。
+        値が None のファイルはGistから削除されます。
+        """
+        if keys is None:
+            file_names = {self._shard_name(key) for key in data}
+            file_names.update(self._file_hashes)
+        else:
+            file_names = {self._shard_name(key) for key in keys}
+
+        # キーのみを走査し、対象シャードに属するものだけを取り出す（レコードは展開しない）
+        shard_keys = {}
+        for key in data:
+            name = self._shard_name(key)
+            if name in file_names:
+                shard_keys.setdefault(name, []).append(key)
+
+        changed = {}
+        for name in file_names:
+            if name in shard_keys:
+                if self._shard_key(name) is None:
+                    content = dump_object((k, data.raw_json(k)) for k in sorted(shard_keys[name]))
+                else:
+                    content = json.dumps(data[self._shard_key(name)], indent=4, ensure_ascii=False)
+                if self._file_hashes.get(name) != self._digest(content):
+                    changed[name] = content
+            elif name in self._file_hashes:
+                # 空になったシャード・削除されたキーのファイルは削除する
+                changed[name] = None
+        return changed
+
+    def commit(self, changed):
+        """
+        変化したファイルのみをGistにPATCHします（ブロッキング）。成功時にTrueを返します。
+        """
+        payload_files = {
+            name: (None if content is None else {"content": content})
+            for name, content in changed.items()
+        }
+        if self._legacy_pending:
+            payload_files[self.legacy_file_name] = None
+        if not payload_files:
+            return True
+        epoch = self.generation
+        if epoch is not None and epoch != self.snapshot_generation:
+            payload_files[self.snapshot_file_name] = {"content": json.dumps({"epoch": epoch})}
+
+        try:
+            if not self._still_holder():
+                print("🚫 他のインスタンスがリースを取得しています。上書きを防ぐため保存を中止します。")
+                return False
+            response = requests.patch(self._api_url(), headers=self._headers(), json={"files": payload_files})
+            response.raise_for_status()
+        except Exception as e:
+            print(f"❌ Save Error: {e}")
+            return False
+        self._remember_version(response, response.json())
+
+        for name, content in changed.items():
+            if content is None:
+                self._file_hashes.pop(name, None)
+            else:
+                self._file_hashes[name] = self._digest(content)
+        self._legacy_pending = False
+        if epoch is not None:
+            self.snapshot_generation = epoch
+        print(f"💾 Data saved to Gist at {datetime.now().strftime('%H:%M:%S')} ({len(changed)} files)")
+        return True
+
+    # --- [LEASE] ---
+    def _read_lease(self, gist):
+        info = gist.get("files", {}).get(self.lease_file_name)
+        if not info:
+            return None
+        try:
+            return json.loads(info.get("content") or "null")
+        except ValueError:
+            return None
+
+    def _write_lease(self, lease):
+        response = requests.patch(
+            self._api_url(), headers=self._headers(),
+            json={"files": {self.lease_file_name: {"content": json.dumps(lease)}}}
+        )
+        response.raise_for_status()
+        self._remember_version(response, response.json())
+        self._lease = lease
+
+    def _lease_expired(self, lease):
+        return lease is None or not lease.get("holder") or time.time() - lease.get("heartbeat", 0) > self.lease_ttl
+
+    def _acquire_lease(self):
+        """
+        リースを取得します（ブロッキング）。保持中のインスタンスがいる場合は後継として登録し、
+        最終保存を終えて引き渡されるか、リースが失効するまで待機します。
+        """
+        lease = self._read_lease(self._fetch_gist())
+        while not self._lease_expired(lease) and lease["holder"] != self.instance_id:
+            if lease.get("successor") != self.instance_id:
+                print(f"🤝 インスタンス {lease['holder']} にLedgerの引き継ぎを要求しています...")
+                lease = dict(lease, successor=self.instance_id)
+                self._write_lease(lease)
+            time.sleep(self.lease_interval / 3)
+            gist = self._fetch_gist(conditional=True)
+            if gist is not None:
+                lease = self._read_lease(gist)
+
+        if lease is None or lease.get("holder") != self.instance_id:
+            # 未取得・失効したリースを取得する（epoch はフェンシング用の世代番号）
+            epoch = (lease or {}).get("epoch", 0) + 1
+            self._write_lease({"holder": self.instance_id, "epoch": epoch, "heartbeat": time.time(), "successor": None})
+        else:
+            self._lease = lease
+        print(f"🔑 Ledger lease acquired: {self.instance_id} (epoch {self._lease['epoch']})")
+
+    def _still_holder(self):
+        """保存の直前に、Gistが他のインスタンスに書き換えられていないかを条件付きリクエストで確認します。"""
+        gist = self._fetch_gist(conditional=True)
+        if gist is None:
+            return True
+        lease = self._read_lease(gist)
+        if lease is not None:
+            self._lease = lease
+        return lease is not None and lease.get("holder") == self.instance_id
+
+    def check_lease(self):
+        """リースを確認し、必要であればハートビートを更新します（ブロッキング）。"""
+        gist = self._fetch_gist(conditional=True)
+        lease = self._lease if gist is None else self._read_lease(gist)
+        if lease is None or lease.get("holder") != self.instance_id:
+            return "lost"
+        if lease.get("successor"):
+            self._lease = lease
+            return "successor"
+        if time.time() - lease.get("heartbeat", 0) > self.lease_ttl / 3:
+            self._write_lease(dict(lease, heartbeat=time.time()))
+        return "held"
+
+    def release_lease(self):
+        """
+        リースを手放します（ブロッキング）。後継が待機していればその場で引き渡し、
+        いなければ次に起動したインスタンスが待たずに取得できるよう失効させます。
+        """
+        lease = self._lease or {}
+        successor = lease.get("successor")
+        try:
+            self._write_lease({
+                "holder": successor,
+                "epoch": lease.get("epoch", 0) + 1,
+                "heartbeat": time.time() if successor else 0,
+                "successor": None,
+            })
+        except Exception as e:
+            print(f"❌ Lease Release Error: {e}")
+            return False
+        if successor:
+            print(f"🤝 Ledgerをインスタンス {successor} に引き渡しました。")
+        return True
+
+
+class JsonFileBackend(StorageBackend):
+    """
+    ローカルのJSONファイルへの保存。一時ファイルへ書き出してから置き換えるため、
+    書き込み中に終了しても既存のファイルは壊れません。
+    """
+    name = "json"
+    needs_full_write = False
+
+    def __init__(self, path):
+        self.path = path
+        self._last_digest = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            print(f"⚠️ {self.path} が見つかりません。新規作成します。")
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read()
+        self._last_digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        return json.loads(content)
+
+    def prepare(self, data, keys):
+        content = dump_object(
+            (key, data.raw_json(key) if is_user_key(key) else json.dumps(data[key], ensure_ascii=False))
+            for key in data
+        )
+        if hashlib.sha1(content.encode("utf-8")).hexdigest() == self._last_digest:
+            return None
+        return content
+
+    def commit(self, content):
+        if content is None:
+            return True
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"❌ Save Error: {e}")
+            return False
+        self._last_digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        print(f"💾 Data saved to {self.path} at {datetime.now().strftime('%H:%M:%S')}")
+        return True
+
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLiteへの保存。ユーザーレコードはJSONのまま保持しつつ、ランキングに使う項目を列として持ち、
+    起動時はその列だけを読み込みます（順位計算は Ledger 側のランキングで行います）。
+    GitHubのトークンなしで完全にオフラインで動作します。
+    """
+    name = "sqlite"
+    lazy = True
+    needs_full_write = False
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # メタデータのキー → 保存済みの内容のハッシュ（変化のないものは書き込まない）
+        self._meta_hashes = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "uid TEXT PRIMARY KEY, "
+            "money INTEGER NOT NULL DEFAULT 0, "
+            "xp INTEGER NOT NULL DEFAULT 0, "
+            "total_study_time INTEGER NOT NULL DEFAULT 0, "
+            "best_fish REAL NOT NULL DEFAULT 0, "
+            "record TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def load(self):
+        data = {}
+        with self._lock:
+            for uid, record in self._conn.execute("SELECT uid, record FROM users"):
+                data[uid] = json.loads(record)
+            for key, value in self._conn.execute("SELECT key, value FROM meta"):
+                data[key] = json.loads(value)
+        return data
+
+    def load_meta(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM meta").fetchall()
+        self._meta_hashes = {key: hash(value) for key, value in rows}
+        return {key: json.loads(value) for key, value in rows}
+
+    def load_index(self):
+        """レコード本体を読まずに、索引列だけを読み込みます。"""
+        columns = ", ".join(INDEXED_FIELDS)
+        with self._lock:
+            return {row[0]: tuple(row[1:]) for row in self._conn.execute(f"SELECT uid, {columns} FROM users")}
+
+    def load_record_raw(self, uid):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM users WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
+
+    def prepare(self, data, keys):
+        if keys is None:
+            # コールド層はこの保存先そのものなので、内容が異なり得るのは未保存のレコードとメタデータだけ
+            keys = data.unsaved_keys() | set(data.meta) | set(self._meta_hashes)
+        upserts, meta_upserts, deletes = [], [], []
+        for key in keys:
+            value = data.peek(key)
+            if value is None:
+                deletes.append(key)
+            elif is_user_key(key):
+                row = [key] + [field_value(value, f) for f in INDEXED_FIELDS]
+                upserts.append(tuple(row) + (json.dumps(value.to_dict(), ensure_ascii=False),))
+            else:
+                content = json.dumps(value, ensure_ascii=False)
+                if self._meta_hashes.get(key) != hash(content):
+                    meta_upserts.append((key, content))
+        return upserts, meta_upserts, deletes
+
+    def commit(self, payload):
+        upserts, meta_upserts, deletes = payload
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO users (uid, money, xp, total_study_time, best_fish, record) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    upserts
+                )
+                self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta_upserts)
+                self._conn.executemany("DELETE FROM users WHERE uid = ?", [(k,) for k in deletes])
+                self._conn.executemany("DELETE FROM meta WHERE key = ?", [(k,) for k in deletes])
+        except sqlite3.Error as e:
+            print(f"❌ Save Error: {e}")
+            return False
+        for key, content in meta_upserts:
+            self._meta_hashes[key] = hash(content)
+        for key in deletes:
+            self._meta_hashes.pop(key, None)
+        return True
@@ -0,0 +1,198 @@
+import heapq
+from array import array
+from datetime import timedelta
+from sortedcontainers import SortedList
+
+# ランキングの集計期間（日数）。当日を含む直近 N 日
+SPANS = {"daily": 1, "weekly": 7, "monthly": 30}
+# 日ごとの記録を保持する日数（最も長い集計期間）
+WINDOW_DAYS = max(SPANS.values())
+
+# study_history に日別の記録を残す日数（これより前の月は月別 "YYYY-MM" へ集約する）
+HISTORY_DAYS = 120
+# study_history に月別の記録を残す月数（これより前の年は年別 "YYYY" へ集約する）
+HISTORY_MONTHS = 24
+
+
+# --- [HISTORY ROLL-UP] ---
+def _rollup_cutoffs(today, keep_days, keep_months):
+    """(この月より前の日別を集約する "YYYY-MM", この年より前の月別を集約する "YYYY")。"""
+    day_cut = (today - timedelta(days=keep_days)).strftime("%Y-%m")
+    month_cut = str((today.year * 12 + today.month - 1 - keep_months) // 12)
+    return day_cut, month_cut
+
+def _bucket(key, day_cut, month_cut):
+    """key（"YYYY-MM-DD" / "YYYY-MM" / "YYYY"）の集約先を返します。集約しない場合は key 自身です。"""
+    if len(key) == 10 and key[:7] < day_cut:
+        key = key[:7]
+    if len(key) == 7 and key[:4] < month_cut:
+        key = key[:4]
+    return key
+
+def rollup_stamp(today, keep_days=HISTORY_DAYS, keep_months=HISTORY_MONTHS):
+    """
+    集約の基準（"YYYY-MM/YYYY"）。月単位でしか変わらず、前回の集約の時から変わっていなければ、
+    その後に記録された日付が新たに集約の対象になることはありません。
+    """
+    return "/".join(_rollup_cutoffs(today, keep_days, keep_months))
+
+def rollup_due(history, today, keep_days=HISTORY_DAYS, keep_months=HISTORY_MONTHS):
+    """集約すべき古い記録があるかどうか。"""
+    day_cut, month_cut = _rollup_cutoffs(today, keep_days, keep_months)
+    return any(_bucket(key, day_cut, month_cut) != key for key in history)
+
+def rollup_history(history, today, keep_days=HISTORY_DAYS, keep_months=HISTORY_MONTHS):
+    """
+    study_history の古い日別の記録を月別へ、古い月別の記録を年別へその場で集約し、集約した項目数を返します。
+    月・年の単位でまとめて集約するため、1つの月（年）に日別（月別）と集約済みの値が混在することはありません。
+    合計値は変わりません。
+    """
+    day_cut, month_cut = _rollup_cutoffs(today, keep_days, keep_months)
+    moves = [(key, _bucket(key, day_cut, month_cut)) for key in history]
+    moves = [(key, bucket) for key, bucket in moves if bucket != key]
+    for key, bucket in moves:
+        history[bucket] = history.get(bucket, 0) + history.pop(key)
+    return len(moves)
+
+def history_total(history, period=""):
+    """
+    period（"YYYY" / "YYYY-MM" / "YYYY-MM-DD"、空文字は全期間）の学習時間の合計。
+    日別・月別・年別の記録が混在していても、その期間に含まれるものをすべて合計します
+    （ただし年別へ集約済みの期間を月単位で問い合わせた場合は、その月の分は含まれません）。
+    """
+    return sum(minutes for key, minutes in history.items() if key.startswith(period))
+
+
+class StudyRing:
+    """
+    直近 WINDOW_DAYS 日分の学習時間（分）を、日付の通し番号（date.toordinal()）で引くリングバッファ。
+    day は最後に記録した日で、それより WINDOW_DAYS 日以上前の分は自然に上書きされます。
+    """
+    __slots__ = ("day", "minutes")
+
+    def __init__(self):
+        self.day = 0
+        self.minutes = array("l", [0] * WINDOW_DAYS)
+
+    def __bool__(self):
+        return any(self.minutes)
+
+    def add(self, day, minutes):
+        """day の学習時間に minutes を加えます。保持期間より古い日は無視します。"""
+        if day > self.day:
+            # 間の日（記録のない日）の枠を空にしてから進める
+            for d in range(max(self.day + 1, day - WINDOW_DAYS + 1), day + 1):
+                self.minutes[d % WINDOW_DAYS] = 0
+            self.day = day
+        elif day <= self.day - WINDOW_DAYS:
+            return
+        self.minutes[day % WINDOW_DAYS] += minutes
+
+    def total(self, today, days):
+        """today を含む直近 days 日間の合計（分）。"""
+        start = max(today - days + 1, self.day - WINDOW_DAYS + 1)
+        end = min(today, self.day)
+        return sum(self.minutes[d % WINDOW_DAYS] for d in range(start, end + 1))
+
+    def items(self):
+        """記録のある (日付の通し番号, 分) を古い順に返します。"""
+        for d in range(self.day - WINDOW_DAYS + 1, self.day + 1):
+            if self.minutes[d % WINDOW_DAYS]:
+                yield d, self.minutes[d % WINDOW_DAYS]
+
+    def to_dict(self):
+        """{"day": 最後に記録した日, "min": 古い順の WINDOW_DAYS 日分の分}。"""
+        return {"day": self.day, "min": [self.minutes[d % WINDOW_DAYS] for d in range(self.day - WINDOW_DAYS + 1, self.day + 1)]}
+
+    @classmethod
+    def from_dict(cls, d):
+        ring = cls()
+        ring.day = d["day"]
+        minutes = d["min"][-WINDOW_DAYS:]
+        for offset, m in enumerate(minutes):
+            ring.minutes[(ring.day - len(minutes) + 1 + offset) % WINDOW_DAYS] = m
+        return ring
+
+
+class StudyBoards:
+    """
+    期間別（SPANS）の学習時間ランキング。直近 WINDOW_DAYS 日分の 日付 → {ユーザーID: 分} を保持し、
+    記録の追加時は該当期間のランキングへ差分を加え、日付が進んだ時は期間から外れた日の分だけを差し引きます。
+    上位N件の照会は日付の解析もユーザーの走査も行いません。
+    """
+    META_KEY = "study_windows"
+
+    def __init__(self, today):
+        self.today = today
+        self.days = {}
+        self.totals = {span: {} for span in SPANS}
+        self.boards = {span: SortedList() for span in SPANS}
+
+    def _bump(self, span, uid, delta):
+        totals = self.totals[span]
+        board = self.boards[span]
+        old = totals.get(uid, 0)
+        new = old + delta
+        if old:
+            board.remove((-old, uid))
+        if new > 0:
+            board.add((-new, uid))
+            totals[uid] = new
+        else:
+            totals.pop(uid, None)
+
+    def advance(self, today):
+        """集計の基準日を today へ進め、各期間から外れた日の分を差し引きます。"""
+        if today <= self.today:
+            return
+        for span, days in SPANS.items():
+            for day, entries in self.days.items():
+                if self.today - days < day <= today - days:
+                    for uid, minutes in entries.items():
+                        self._bump(span, uid, -minutes)
+        self.days = {day: entries for day, entries in self.days.items() if day > today - WINDOW_DAYS}
+        self.today = today
+
+    def add(self, uid, day, minutes):
+        """uid の day（日付の通し番号）の学習時間に minutes を加えます。"""
+        self.advance(day)
+        if day <= self.today - WINDOW_DAYS:
+            return
+        entries = self.days.setdefault(day, {})
+        entries[uid] = entries.get(uid, 0) + minutes
+        for span, days in SPANS.items():
+            if day > self.today - days:
+                self._bump(span, uid, minutes)
+
+    def top(self, span, limit=10, members=None):
+        """[(ユーザーID, 分), ...] を上位から返します。members を指定した場合はそのユーザーのみ。"""
+        if members is None:
+            return [(uid, -neg) for neg, uid in self.boards[span].islice(0, limit)]
+        totals = self.totals[span]
+        return heapq.nlargest(limit, ((uid, totals[uid]) for uid in map(int, members) if uid in totals),
+                              key=lambda entry: entry[1])
+
+    # --- [SERIALIZATION] ---
+    def to_dict(self):
+        return {
+            "today": self.today,
+            "days": {str(day): {str(uid): m for uid, m in entries.items()} for day, entries in self.days.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d, today):
+        boards = cls(d.get("today", today))
+        for day, entries in sorted((int(k), v) for k, v in d.get("days", {}).items()):
+            for uid, minutes in entries.items():
+                boards.add(int(uid), day, minutes)
+        boards.advance(today)
+        return boards
+
+    @classmethod
+    def rebuild(cls, users, today):
+        """保存された集計がまだ無い場合に、各ユーザーのリングバッファ（(ユーザーID, レコード) の列）から作ります。"""
+        boards = cls(today)
+        for uid, record in users:
+            for day, minutes in record.study_recent.items():
+                boards.add(uid, day, minutes)
+        return boards
@@ -0,0 +1,61 @@
+import asyncio
+
+from ledger import Ledger
+from storage import JsonFileBackend
+
+
+def make_ledger(tmp_path):
+    return Ledger(
+        JsonFileBackend(str(tmp_path / "ledger.json")),
+        journal_path=str(tmp_path / "ledger.journal"),
+        cold_path=str(tmp_path / "ledger-cold.db"),
+    )
+
+
+def replay(tmp_path, key, write):
+    """write(ledger) を実行し、保存せずに終了したあとジャーナルから復元した値を返す"""
+    async def run():
+        ledger = make_ledger(tmp_path)
+        await ledger.load()
+        write(ledger)
+        expected = ledger.get_meta(key)
+        ledger._journal.flush()
+        restored = make_ledger(tmp_path)
+        await restored.load()
+        return expected, restored.get_meta(key)
+    return asyncio.run(run())
+
+
+def test_in_place_nested_change_survives_replay(tmp_path):
+    def write(ledger):
+        value = {"species": {"Tuna": [50.0, 1, 1]}}
+        ledger.set_meta("fishing_records", value)
+        value["species"]["Tuna"][0] = 80.0
+        value["species"]["Tuna"][2] += 1
+        ledger.set_meta("fishing_records", value)
+
+    expected, restored = replay(tmp_path, "fishing_records", write)
+    assert restored == expected == {"species": {"Tuna": [80.0, 1, 2]}}
+
+
+def test_new_dict_sharing_sub_objects_survives_replay(tmp_path):
+    sessions = {"1:2": [100, 100]}
+
+    def write(ledger):
+        ledger.set_meta("voice_sessions", {"sessions": sessions})
+        sessions["1:2"][1] = 160
+        ledger.set_meta("voice_sessions", {"sessions": sessions})
+
+    expected, restored = replay(tmp_path, "voice_sessions", write)
+    assert restored == expected == {"sessions": {"1:2": [100, 160]}}
+
+
+def test_removed_key_survives_replay(tmp_path):
+    def write(ledger):
+        value = {"a": {"x": 1}, "b": 2}
+        ledger.set_meta("image_gallery", value)
+        del value["a"]
+        ledger.set_meta("image_gallery", value)
+
+    expected, restored = replay(tmp_path, "image_gallery", write)
+    assert restored == expected == {"b": 2}
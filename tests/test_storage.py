@@ -0,0 +1,16 @@
+import json
+
+from storage import iter_json_members
+
+DOCUMENT = '{"a": 49270.5e3, "b": [1, 2.5], "c": -12, "d": {"x": 1E-2}, "e": true, "f": 7}'
+
+
+def test_members_split_at_every_offset():
+    expected = list(json.loads(DOCUMENT).items())
+    for offset in range(1, len(DOCUMENT)):
+        chunks = [DOCUMENT[:offset], DOCUMENT[offset:]]
+        assert list(iter_json_members(chunks)) == expected, offset
+
+
+def test_members_one_character_per_chunk():
+    assert list(iter_json_members(DOCUMENT)) == list(json.loads(DOCUMENT).items())
@@ -0,0 +1,187 @@
+"""
+釣り報酬の経済シミュレーター / 抽選ベンチマーク（オフライン実行用）。
+
+fish_catalog.json と cogs/fishing.py と同じ価格式（base_price * size / size_range[0]）を使い、
+NumPy で数百万回分の釣りを一括で抽選して、1回あたりの期待値・分散・パーセンタイル、
+SSR以上が釣れるまでの回数の分布を出力します。--daily を付けると、勉強・じゃんけん・換金を含めた
+1日あたりの収入も試算します。Botやネットワークには一切接続しません。
+
+    python tools/economy_sim.py --casts 2000000
+    python tools/economy_sim.py --pool sea_night --daily --casts-per-day 40 --study-minutes 90
+    python tools/economy_sim.py --bench
+
+NumPy が必要です（Bot本体の依存関係には含まれません）: pip install numpy
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("❌ このツールには NumPy が必要です: pip install numpy")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fishing_catalog import FishCatalog, RARITY_ORDER  # noqa: E402
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fish_catalog.json")
+
+# Bot側の報酬設定（cogs/study.py・cogs/entertainment.py・cogs/exchange.py と揃えること）
+STUDY_CR_PER_MINUTES = 2    # 2分につき1cr
+JANKEN_REWARD = 10          # 勝利で10cr（勝率1/3）
+EXCHANGE_RATE = 0.1         # 10 XP → 1 cr
+
+# 「大物」とみなすレア度（この序列以上）
+BIG_RARITY = "SSR"
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+# --- [VECTORIZED SAMPLING] ---
+class PoolArrays:
+    """1つのプールの抽選に必要な表を NumPy 配列にまとめたもの。"""
+
+    def __init__(self, pool, species):
+        prob, alias = pool.sampler.table
+        self.pool = pool
+        self.prob = np.array(prob)
+        self.alias = np.array(alias, dtype=np.int64)
+        entries = [species[sid] for sid in pool.species_ids]
+        self.names = [e["name"] for e in entries]
+        self.rarity = np.array([RARITY_ORDER.index(e["rarity"]) for e in entries])
+        self.low = np.array([e["size_range"][0] for e in entries], dtype=float)
+        self.high = np.array([e["size_range"][1] for e in entries], dtype=float)
+        self.base = np.array([e["base_price"] for e in entries], dtype=float)
+
+    def cast(self, rng, n):
+        """n 回分の (種の番号, 価格) を返します。エイリアス法を配列演算でそのまま行います。"""
+        i = rng.integers(0, len(self.prob), n)
+        idx = np.where(rng.random(n) < self.prob[i], i, self.alias[i])
+        size = np.round(rng.uniform(self.low[idx], self.high[idx]), 1)
+        price = np.floor(self.base[idx] * (size / self.low[idx])).astype(np.int64)
+        return idx, price
+
+    def cast_chunked(self, rng, n, chunk=1_000_000):
+        idx_parts, price_parts = [], []
+        for start in range(0, n, chunk):
+            idx, price = self.cast(rng, min(chunk, n - start))
+            idx_parts.append(idx)
+            price_parts.append(price)
+        return np.concatenate(idx_parts), np.concatenate(price_parts)
+
+    @property
+    def big_probability(self):
+        weights = np.array(self.pool.weights)
+        return weights[self.rarity >= RARITY_ORDER.index(BIG_RARITY)].sum() / weights.sum()
+
+
+# --- [REPORTS] ---
+def report_pool(arrays, rng, casts, trials):
+    start = time.perf_counter()
+    idx, price = arrays.cast_chunked(rng, casts)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n🎣 プール: {arrays.pool.id}（{casts:,} 回 / {elapsed:.2f} 秒, {casts / elapsed:,.0f} 回/秒）")
+    print(f"  期待値: {price.mean():,.2f} cr / 回   標準偏差: {price.std():,.2f}")
+    pct = np.percentile(price, PERCENTILES)
+    print("  パーセンタイル: " + "  ".join(f"p{p}={v:,.0f}" for p, v in zip(PERCENTILES, pct)))
+
+    rarity = arrays.rarity[idx]
+    print("  レア度別:")
+    for r, name in enumerate(RARITY_ORDER):
+        mask = rarity == r
+        if not mask.any():
+            continue
+        share = mask.mean()
+        print(f"    {name:<9} {share:8.4%}  収入の {price[mask].sum() / price.sum():7.2%}")
+
+    p = arrays.big_probability
+    if p > 0:
+        waits = rng.geometric(p, trials)
+        wait_pct = np.percentile(waits, PERCENTILES)
+        print(f"  {BIG_RARITY}以上までの回数: 平均 {waits.mean():,.1f}（理論値 {1 / p:,.1f}）  "
+              + "  ".join(f"p{q}={v:,.0f}" for q, v in zip(PERCENTILES, wait_pct)))
+    return price.mean(), price.var()
+
+
+def report_daily(arrays, rng, days, casts_per_day, study_minutes, janken_per_day, exchange):
+    """1日あたりの収入（cr）の分布。勉強時間はポアソン分布、じゃんけんは二項分布で近似します。"""
+    _, price = arrays.cast_chunked(rng, days * casts_per_day)
+    fishing = price.reshape(days, casts_per_day).sum(axis=1) if casts_per_day else np.zeros(days)
+    minutes = np.minimum(rng.poisson(study_minutes, days), 720) if study_minutes else np.zeros(days, dtype=int)
+    study = minutes // STUDY_CR_PER_MINUTES
+    janken = rng.binomial(janken_per_day, 1 / 3, days) * JANKEN_REWARD
+    xp_cr = np.floor(minutes * EXCHANGE_RATE) if exchange else np.zeros(days)
+    total = fishing + study + janken + xp_cr
+
+    print(f"\n📅 1日あたりの収入（{days:,} 日分, 釣り {casts_per_day} 回 / 勉強 平均{study_minutes}分 / じゃんけん {janken_per_day} 回"
+          f"{' / 勉強XPを換金' if exchange else ''}）")
+    for label, values in (("釣り", fishing), ("勉強", study), ("じゃんけん", janken), ("換金", xp_cr), ("合計", total)):
+        pct = np.percentile(values, PERCENTILES)
+        print(f"  {label:<6} 平均 {values.mean():>10,.1f} cr  " + "  ".join(f"p{p}={v:,.0f}" for p, v in zip(PERCENTILES, pct)))
+
+
+def bench(catalog, pool, draws):
+    """同じプールでの抽選速度の比較（random.choices / AliasSampler / NumPy 一括）。"""
+    print(f"\n⏱️ 抽選ベンチマーク（{pool.id}, {draws:,} 回）")
+    ids, weights = pool.species_ids, pool.weights
+
+    start = time.perf_counter()
+    random.choices(ids, weights=weights, k=draws)
+    t_choices = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sample = pool.sampler.sample
+    for _ in range(draws):
+        sample()
+    t_alias = time.perf_counter() - start
+
+    arrays = PoolArrays(pool, catalog.species)
+    rng = np.random.default_rng()
+    start = time.perf_counter()
+    arrays.cast(rng, draws)
+    t_numpy = time.perf_counter() - start
+
+    for label, t in (("random.choices(k=n)", t_choices), ("AliasSampler.sample x n", t_alias), ("NumPy 一括（価格計算込み）", t_numpy)):
+        print(f"  {label:<28} {t:8.3f} 秒  {draws / t:>14,.0f} 回/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="釣り報酬の経済シミュレーター")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="図鑑データのパス")
+    parser.add_argument("--pool", action="append", help="対象のプールID（複数指定可、既定はすべて）")
+    parser.add_argument("--casts", type=int, default=2_000_000, help="プールごとの試行回数")
+    parser.add_argument("--trials", type=int, default=200_000, help="大物までの回数の試行数")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--daily", action="store_true", help="1日あたりの収入も試算する")
+    parser.add_argument("--days", type=int, default=100_000)
+    parser.add_argument("--casts-per-day", type=int, default=30)
+    parser.add_argument("--study-minutes", type=int, default=60)
+    parser.add_argument("--janken-per-day", type=int, default=10)
+    parser.add_argument("--exchange", action="store_true", help="勉強で得たXPを換金する前提で試算する")
+    parser.add_argument("--bench", action="store_true", help="抽選方式のベンチマークのみを行う")
+    parser.add_argument("--bench-draws", type=int, default=500_000)
+    args = parser.parse_args()
+
+    catalog = FishCatalog(args.catalog)
+    pools = [p for p in catalog.pools if not args.pool or p.id in args.pool]
+    if not pools:
+        sys.exit(f"❌ プールが見つかりません: {', '.join(args.pool)}")
+
+    if args.bench:
+        for pool in pools:
+            bench(catalog, pool, args.bench_draws)
+        return
+
+    rng = np.random.default_rng(args.seed)
+    for pool in pools:
+        arrays = PoolArrays(pool, catalog.species)
+        report_pool(arrays, rng, args.casts, args.trials)
+        if args.daily:
+            report_daily(arrays, rng, args.days, args.casts_per_day, args.study_minutes,
+                         args.janken_per_day, args.exchange)
+
+
+if __name__ == "__main__":
+    main()
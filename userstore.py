@@ -0,0 +1,264 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from storage import INDEXED_FIELDS, is_user_key, field_value
+from records import UserRecord, stored_value
+from leaderboard import Leaderboards
+
+def index_entry(record):
+    """ランキング・残高照会用の圧縮索引（INDEXED_FIELDS の順の値）を作ります。"""
+    return tuple(field_value(record, f) for f in INDEXED_FIELDS)
+
+def stored_index_entry(d):
+    """保存されていた辞書から、レコードを展開・移行せずに索引を作ります。"""
+    return tuple(stored_value(d, f) for f in INDEXED_FIELDS)
+
+
+class LocalColdTier:
+    """
+    退避したユーザーレコードをJSON文字列のままローカルのSQLiteファイルに保持するコールド層。
+    Gist・JSONファイルなど、レコード単位で読み出せない保存先と組み合わせて使います。
+    """
+    writable = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS records (uid TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        self._conn.commit()
+
+    def reset(self, rows):
+        """rows: [(ユーザーID, JSON文字列), ...] でコールド層全体を置き換えます。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records")
+            self._conn.executemany("INSERT INTO records (uid, record) VALUES (?, ?)", rows)
+
+    def get_raw(self, uid):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM records WHERE uid = ?", (uid,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, uid, record):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO records (uid, record) VALUES (?, ?)",
+                (uid, json.dumps(record.to_dict(), ensure_ascii=False))
+            )
+        return True
+
+    def delete(self, uid):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records WHERE uid = ?", (uid,))
+
+
+class BackendColdTier:
+    """
+    レコード単位で読み出せる保存先（SQLite）自体をコールド層として使います。
+    保存先への書き込みは flush() が行うため、未保存のレコードは退避しません。
+    """
+    writable = False
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_raw(self, uid):
+        return self.backend.load_record_raw(uid)
+
+    def put(self, uid, record):
+        return False
+
+    def delete(self, uid):
+        pass
+
+
+class TieredUserStore(MutableMapping):
+    """
+    ユーザーレコードのホット/コールド2層ストア。
+    - 索引: 全ユーザーの (money, xp, total_study_time, best_fish) だけを常に保持
+    - ホット層: 最近アクセスしたレコード（LRU順）
+    - コールド層: それ以外のレコード（JSON文字列のまま保持し、初回アクセス時に展開）
+    ユーザー以外のトップレベルキー（image_gallery 等）は常にメモリ上に保持します。
+    dict と同じように扱えますが、全件を走査する場合は iter_records() を使ってください。
+    """
+
+    def __init__(self, cold, max_hot_records=5000, idle_ttl=1800, min_idle=60):
+        self.cold = cold
+        self.max_hot_records = max_hot_records
+        self.idle_ttl = idle_ttl
+        # 参照を保持したまま await しているコマンドがあり得るため、直近にアクセスされたレコードは退避しない
+        self.min_idle = min_idle
+
+        self.meta = {}
+        self.index = {}
+        # 索引の変更に合わせて差分更新されるランキング
+        self.boards = Leaderboards()
+        self.hot = OrderedDict()
+        self._last_access = {}
+        # 展開後に変更され、コールド層の内容が古くなっているレコード
+        # （保存先をコールド層とする場合は、削除されてまだ保存先に残っているキーも含む）
+        self._modified = set()
+
+    # --- [LOADING] ---
+    def bulk_load(self, data):
+        """
+        保存先から読み込んだ全データを索引とコールド層へ振り分けます（ホット層は空で開始）。
+        ユーザーレコードは保存されていた形のままコールド層へ格納し、現在のスキーマへの移行は
+        展開時（_hydrate() / peek()）に行います。
+        """
+        rows = []
+        for key, value in data.items():
+            if is_user_key(key):
+                self.index[key] = stored_index_entry(value)
+                rows.append((key, json.dumps(value, ensure_ascii=False)))
+            else:
+                self.meta[key] = value
+        self.cold.reset(rows)
+        self.boards.rebuild(self.index)
+
+    def load_index(self, meta, index):
+        """索引とメタデータのみを読み込みます（レコードは保存先から遅延読み込み）。"""
+        self.meta.update(meta)
+        self.index.update(index)
+        self.boards.rebuild(self.index)
+
+    # --- [MAPPING] ---
+    def __contains__(self, key):
+        return key in self.index or key in self.meta
+
+    def __getitem__(self, key):
+        if not is_user_key(key):
+            return self.meta[key]
+        record = self.hot.get(key)
+        if record is None:
+            if key not in self.index:
+                raise KeyError(key)
+            record = self._hydrate(key)
+        self.hot.move_to_end(key)
+        self._last_access[key] = time.monotonic()
+        return record
+
+    def __setitem__(self, key, value):
+        if not is_user_key(key):
+            self.meta[key] = value
+            return
+        self.hot[key] = value
+        self.hot.move_to_end(key)
+        self._last_access[key] = time.monotonic()
+        self._set_index(key, index_entry(value))
+        self._modified.add(key)
+
+    def __delitem__(self, key):
+        if not is_user_key(key):
+            del self.meta[key]
+            return
+        if key not in self.index:
+            raise KeyError(key)
+        self.boards.update(key, self.index.pop(key), None)
+        self.hot.pop(key, None)
+        self._last_access.pop(key, None)
+        if self.cold.writable:
+            self._modified.discard(key)
+        else:
+            self._modified.add(key)
+        self.cold.delete(key)
+
+    def __iter__(self):
+        yield from self.meta
+        yield from list(self.index)
+
+    def __len__(self):
+        return len(self.meta) + len(self.index)
+
+    def _set_index(self, key, entry):
+        old = self.index.get(key)
+        if old != entry:
+            self.index[key] = entry
+            self.boards.update(key, old, entry)
+
+    def _hydrate(self, key):
+        raw = self.cold.get_raw(key)
+        record = UserRecord.from_dict(json.loads(raw)) if raw else UserRecord()
+        self.hot[key] = record
+        return record
+
+    # --- [NON-PROMOTING ACCESS] ---
+    def peek(self, key):
+        """ホット層へ昇格させずにレコードを返します（存在しない場合は None）。"""
+        if not is_user_key(key):
+            return self.meta.get(key)
+        record = self.hot.get(key)
+        if record is not None:
+            return record
+        if key not in self.index:
+            return None
+        raw = self.cold.get_raw(key)
+        return UserRecord.from_dict(json.loads(raw)) if raw else None
+
+    def raw_json(self, key):
+        """ユーザーレコードをJSON文字列で返します。コールド層のレコードは展開せずにそのまま返します。"""
+        record = self.hot.get(key)
+        if record is not None:
+            return json.dumps(record.to_dict(), ensure_ascii=False)
+        return self.cold.get_raw(key)
+
+    def iter_records(self):
+        """全ユーザーの (キー, レコード) を返します。コールド層のレコードはホット層に昇格させません。"""
+        for key in list(self.index):
+            record = self.peek(key)
+            if record is not None:
+                yield key, record
+
+    def refresh(self, key):
+        """
+        レコードの変更を索引に反映し、コールド層の内容が古いことを記録します。
+        展開済みのレコードを返します（ホット層にない場合は None）。
+        """
+        record = self.hot.get(key)
+        if record is not None:
+            self._set_index(key, index_entry(record))
+            self._modified.add(key)
+        return record
+
+    def unsaved_keys(self):
+        """保存先をコールド層とする場合に、変更・削除がまだ保存先へ書き込まれていないユーザーのキー。"""
+        return set(self._modified)
+
+    def committed(self, keys, pending=()):
+        """
+        保存先への書き込みが完了したキーを通知します（保存先をコールド層とする場合に退避可能になる）。
+        pending には書き込み中に再び変更されたキーを渡します（未保存のまま残します）。
+        """
+        if not self.cold.writable:
+            if keys is None:
+                keys = set(self._modified)
+            self._modified.difference_update(set(keys) - set(pending))
+
+    # --- [EVICTION] ---
+    def evict(self):
+        """
+        アイドル時間が idle_ttl を超えたレコードと、max_hot_records を超えた分の
+        最も古いレコードをコールド層へ退避します。退避した件数を返します。
+        """
+        now = time.monotonic()
+        over = len(self.hot) - self.max_hot_records
+        evicted = 0
+        for key in list(self.hot):
+            idle = now - self._last_access.get(key, 0)
+            if idle < self.min_idle:
+                # LRU順のため、以降のレコードもすべて直近にアクセスされている
+                break
+            if idle < self.idle_ttl and over <= 0:
+                break
+            if key in self._modified:
+                if not self.cold.put(key, self.hot[key]):
+                    continue
+                self._modified.discard(key)
+            del self.hot[key]
+            self._last_access.pop(key, None)
+            over -= 1
+            evicted += 1
+        return evicted